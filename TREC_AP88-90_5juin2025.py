@@ -48,6 +48,7 @@ import time
 from tqdm.notebook import tqdm
 import traceback
 import os
+import glob
 from jnius import JavaException # Importer seulement JavaException, ClassicSimilarity n'est pas utilisé
 
 # Définir K_RESULTS
@@ -61,9 +62,12 @@ try:
     preprocess_text;
     if not os.path.exists(INDEX_DIR_BASELINE): raise FileNotFoundError(f"Index Baseline restauré manquant: {INDEX_DIR_BASELINE}")
     if not os.path.exists(INDEX_DIR_PREPROC): raise FileNotFoundError(f"Index Preprocessed restauré manquant: {INDEX_DIR_PREPROC}")
-    # Vérifier aussi que les fichiers de corpus sont là (restaurés ou recréés)
-    if not os.path.exists(os.path.join(CORPUS_DIR, "ap_docs.jsonl")): raise FileNotFoundError("ap_docs.jsonl manquant.")
-    if not os.path.exists(os.path.join(CORPUS_DIR, "ap_docs_preprocessed.jsonl")): raise FileNotFoundError("ap_docs_preprocessed.jsonl manquant.")
+    # Vérifier aussi que les shards du corpus sont là (restaurés ou recréés) : ap_docs.NN.jsonl[.gz|.zst] (cellules 0.4c et 1.3)
+    jsonl_output_dir = globals().get('JSONL_OUTPUT_DIR', os.path.join(CORPUS_DIR, "ap_docs"))
+    if not glob.glob(os.path.join(jsonl_output_dir, "*.jsonl*")): raise FileNotFoundError(f"Shards du corpus manquants dans {jsonl_output_dir}.")
+    # En mode Lucene, la cellule 1.3 n'écrit aucun corpus prétraité (l'index prétraité lit le corpus source)
+    preproc_corpus_written = globals().get('PREPROC_ANALYZER', "python") != "lucene"
+    if preproc_corpus_written and not glob.glob(os.path.join(JSONL_PREPROC_DIR, "*.jsonl*")): raise FileNotFoundError(f"Shards prétraités manquants dans {JSONL_PREPROC_DIR}.")
 
 except NameError as e: print(f"ERREUR: Variable {e} manquante. Exécutez config complète."); raise
 except FileNotFoundError as e: print(f"ERREUR: {e}"); raise
@@ -4975,14 +4979,276 @@ print("\n[8/9] Définition de la fonction preprocess_text...")
 # (Déjà fait plus haut, mais redondance sans danger)
 import nltk
 from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from nltk.stem import WordNetLemmatizer, PorterStemmer
 from nltk.tokenize import word_tokenize
 import string
+import re
+import hashlib
+import json
+import mmap
+import struct
+from array import array
+from functools import lru_cache
 # Utiliser des noms de variables différents pour éviter conflits potentiels
-stop_words_set_global = set(stopwords.words('english'))
+# Figé (frozenset) : l'empreinte de l'analyseur (ANALYZER_CONFIG, ANALYZER_TAG), la table de lemmes et le cache de
+# normalize_token sont calculés à partir de cet ensemble. Pour changer les stopwords, modifier cette ligne et
+# ré-exécuter la Partie 7, qui recalcule l'empreinte et recrée le cache.
+stop_words_set_global = frozenset(stopwords.words('english'))
 lemmatizer_obj_global = WordNetLemmatizer()
-def preprocess_text(text):
-    if not isinstance(text, str): return ""
+stemmer_obj_global = PorterStemmer()
+# --- Registre des analyseurs nommés (remplace les redéfinitions successives de preprocess_text) ---
+# Chaque entrée fixe la normalisation d'un token : filtre (isalpha / isalnum, après minuscules et tokenisation)
+# puis racinisation. Les mots vides de stop_words_set_global sont toujours retirés.
+# Le tokeniseur regex (TOKENIZER_MODE) n'est garanti identique à word_tokenize qu'avec le filtre isalpha.
+ANALYZERS = {
+    "none": {'analyzer': 'identity', 'token_filter': 'isalpha'},
+    "porter": {'analyzer': 'porter_stemmer', 'token_filter': 'isalpha'},
+    "lemma": {'analyzer': 'wordnet_lemmatizer', 'token_filter': 'isalpha'},
+    "porter-alnum": {'analyzer': 'porter_stemmer', 'token_filter': 'isalnum'},
+}
+ANALYZER_NAME = "lemma"
+TOKEN_STEMMERS = {'identity': str, 'porter_stemmer': stemmer_obj_global.stem,
+                  'wordnet_lemmatizer': lemmatizer_obj_global.lemmatize}
+TOKEN_FILTERS = {'isalpha': str.isalpha, 'isalnum': str.isalnum}
+if ANALYZER_NAME not in ANALYZERS:
+    raise ValueError(f"Analyseur inconnu: {ANALYZER_NAME} (disponibles: {', '.join(ANALYZERS)})")
+stem_token = TOKEN_STEMMERS[ANALYZERS[ANALYZER_NAME]['analyzer']]
+keep_token = TOKEN_FILTERS[ANALYZERS[ANALYZER_NAME]['token_filter']]
+# Table persistante forme de surface -> lemme : un fichier trié, mappé en mémoire en lecture seule
+# (partagé par les workers après fork) et réutilisé d'une session à l'autre. Le nom du fichier dépend
+# de la configuration de l'analyseur : changer de lemmatiseur, de stopwords ou de version NLTK crée une autre table.
+STEM_TABLE_DIR = os.path.join(DRIVE_PROJECT_PATH, "stem_tables")
+STEM_TABLE_MAGIC = b"STEMTBL1"
+
+def analyzer_config_fingerprint(config):
+    """Hachage court et stable d'une configuration d'analyseur (dict sérialisable en JSON)."""
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+class StemTable:
+    """Table token -> lemme persistée dans un fichier mappé en mémoire, avec les entrées nouvelles en mémoire.
+
+    Format : magic (8 octets), nombre d'entrées (uint32), puis nombre+1 offsets uint32 absolus,
+    puis les entrées triées "token\\0lemme" (UTF-8). La recherche est une dichotomie dans le mmap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.new_entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        self.count, self.offsets, self.data, self._file = 0, None, b"", None
+        if not os.path.exists(self.path):
+            return
+        self._file = open(self.path, 'rb')
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.data = self._file.read() # Système de fichiers sans mmap (certains montages FUSE)
+        if self.data[:8] != STEM_TABLE_MAGIC:
+            print(f"ATTENTION: Table de lemmes illisible ({self.path}), elle sera reconstruite.")
+            self.data = b""
+            return
+        self.count = struct.unpack_from('<I', self.data, 8)[0]
+        self.offsets = array('I')
+        self.offsets.frombytes(self.data[12:12 + 4 * (self.count + 1)])
+
+    def __len__(self):
+        return self.count + len(self.new_entries)
+
+    def _find(self, key):
+        """Valeur (octets) de key (octets) dans le fichier, ou None : dichotomie dans le mmap."""
+        offsets, data = self.offsets, self.data
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = offsets[mid], offsets[mid + 1]
+            sep = data.find(b"\0", start, end)
+            entry_key = data[start:sep]
+            if entry_key < key:
+                lo = mid + 1
+            elif entry_key > key:
+                hi = mid
+            else:
+                return data[sep + 1:end]
+        return None
+
+    def get(self, token):
+        """Lemme enregistré pour token, ou None."""
+        value = self.new_entries.get(token)
+        if value is not None:
+            return value
+        value = self._find(token.encode('utf-8'))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def add(self, token, value):
+        self.new_entries[token] = value
+
+    def drain_new(self):
+        """Retourne et oublie les entrées ajoutées depuis le dernier appel (renvoyées par les workers)."""
+        new_entries, self.new_entries = self.new_entries, {}
+        return new_entries
+
+    def _file_entries(self):
+        """Entrées du fichier (clé, valeur) en octets, dans l'ordre trié, lues une à une dans le mmap."""
+        data, offsets = self.data, self.offsets
+        for i in range(self.count):
+            start, end = offsets[i], offsets[i + 1]
+            sep = data.find(b"\0", start, end)
+            yield data[start:sep], data[sep + 1:end]
+
+    def items(self):
+        for token, value in self._file_entries():
+            yield token.decode('utf-8'), value.decode('utf-8')
+        yield from self.new_entries.items()
+
+    def _merged_entries(self, new_entries):
+        """Fusion en flux des entrées du fichier et des nouvelles entrées triées (la nouvelle valeur l'emporte)."""
+        old_entries, new_entries = self._file_entries(), iter(new_entries)
+        old, new = next(old_entries, None), next(new_entries, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                yield old
+                old = next(old_entries, None)
+                continue
+            if old is not None and old[0] == new[0]:
+                old = next(old_entries, None)
+            yield new
+            new = next(new_entries, None)
+
+    def save(self):
+        """Fusionne les nouvelles entrées dans le fichier (écriture atomique). Retourne le nombre d'entrées ajoutées.
+
+        Les entrées sont écrites au fil de la fusion : seuls les offsets et les nouvelles entrées sont en mémoire.
+        """
+        added = len(self.new_entries)
+        if not added:
+            return 0
+        new_entries = sorted((token.encode('utf-8'), value.encode('utf-8')) for token, value in self.new_entries.items())
+        count = self.count + sum(1 for key, _ in new_entries if self._find(key) is None)
+        header_size = 12 + 4 * (count + 1)
+        offsets, position = array('I'), header_size
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb', buffering=1 << 20) as f:
+            f.write(STEM_TABLE_MAGIC + struct.pack('<I', count))
+            f.seek(header_size) # Offsets écrits à la fin, une fois toutes les positions connues
+            for key, value in self._merged_entries(new_entries):
+                offsets.append(position)
+                f.write(key + b"\0" + value)
+                position += len(key) + 1 + len(value)
+            offsets.append(position)
+            f.seek(12)
+            f.write(offsets.tobytes())
+        os.replace(tmp_path, self.path) # Les workers déjà lancés gardent l'ancien mapping
+        self.close()
+        self.new_entries = {}
+        self._open()
+        return added
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+        self.data, self._file = b"", None
+
+ANALYZER_CONFIG = {**ANALYZERS[ANALYZER_NAME], 'lowercase': True,
+                   'stopwords': hashlib.blake2b(' '.join(sorted(stop_words_set_global)).encode('utf-8'), digest_size=8).hexdigest(),
+                   'nltk_version': nltk.__version__}
+STEM_TABLE_PATH = os.path.join(STEM_TABLE_DIR, f"stem_table.{analyzer_config_fingerprint(ANALYZER_CONFIG)}.bin")
+stem_table = StemTable(STEM_TABLE_PATH)
+print(f"  Analyseur {ANALYZER_NAME}, table de lemmes persistante: {STEM_TABLE_PATH} ({len(stem_table)} entrées).")
+
+TOKEN_CACHE_SIZE = 1 << 19 # Formes de surface gardées en cache (LRU) ; AP en compte quelques centaines de milliers
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def normalize_token(token):
+    """Forme analysée d'un token, ou "" s'il est filtré (keep_token faux ou mot vide).
+
+    Ordre de recherche : cache LRU du processus, puis table persistante, puis l'analyseur (résultat ajouté à la table).
+    """
+    if not keep_token(token) or token in stop_words_set_global:
+        return ""
+    lemma = stem_table.get(token)
+    if lemma is None:
+        lemma = stem_token(token)
+        stem_table.add(token, lemma)
+    return lemma
+
+def token_cache_stats():
+    """Compteurs du cache de normalize_token (partagé par les documents et les requêtes du même processus)."""
+    info = normalize_token.cache_info()
+    lookups = info.hits + info.misses
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0}
+
+# --- Tokeniseur : "nltk" (word_tokenize, référence) ou "regex" (un motif compilé, voir la cellule 1.4a) ---
+# Seuls les tokens alphabétiques sont gardés : le mode regex reproduit ce flux sans Punkt ni règles Treebank
+# complètes. Les mots liés par - . / ' restent entiers (et sont donc rejetés par isalpha, comme avec NLTK),
+# les contractions sont coupées comme Treebank ("don't" -> "do"), "c++" reste un seul token, et le point final
+# d'une abréviation connue de Punkt ("mr.") ou d'une initiale reste attaché au mot (token rejeté) au lieu de
+# marquer une fin de phrase.
+TOKENIZER_MODE = "nltk"
+REGEX_TOKEN_PATTERN = re.compile(r"\w+(?:[-'./]\w+)*(?:\.|\++)?")
+INITIAL_BREAK_PATTERN = re.compile(r"\s+(?:\d|[^\w\s?;:,!.]|\.\.)")
+CONTRACTION_SUFFIX_PATTERN = re.compile(r"(?:n't|'s|'m|'d|'ll|'re|'ve)$")
+TREEBANK_SPLIT_WORDS = {"cannot": ["can", "not"], "gimme": ["gim", "me"], "gonna": ["gon", "na"],
+                        "gotta": ["got", "ta"], "lemme": ["lem", "me"], "wanna": ["wan", "na"]}
+
+def load_punkt_abbreviations():
+    """Abréviations du modèle Punkt anglais utilisé par word_tokenize (liste réduite si le modèle est absent)."""
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer # NLTK >= 3.8.2 (punkt_tab)
+        return set(PunktTokenizer('english')._params.abbrev_types)
+    except Exception:
+        pass
+    try:
+        return set(nltk.data.load('tokenizers/punkt/english.pickle')._params.abbrev_types)
+    except Exception:
+        print("  ATTENTION: modèle Punkt introuvable, liste d'abréviations réduite pour le tokeniseur regex.")
+        return {"mr", "mrs", "ms", "dr", "jr", "sr", "st", "gov", "sen", "rep", "gen", "col", "lt", "sgt", "inc",
+                "corp", "co", "ltd", "jan", "feb", "aug", "sept", "oct", "nov", "dec", "u.s", "no", "vs"}
+
+PUNKT_ABBREVIATIONS = load_punkt_abbreviations()
+
+def regex_tokenize(text):
+    """Tokens de text (déjà en minuscules) dont les tokens alphabétiques suivent ceux de word_tokenize."""
+    tokens = []
+    matches = list(REGEX_TOKEN_PATTERN.finditer(text))
+    # Le point final du texte est toujours détaché par Treebank, même après une abréviation
+    last = len(matches) - 1 if text.rstrip().rstrip(')]}>"\'').endswith(".") else -1
+    for position, match in enumerate(matches):
+        token = match.group()
+        if token[-1] == "." and position != last:
+            word = token[:-1]
+            if len(word) == 1:
+                # Punkt coupe la phrase après une initiale suivie d'un chiffre ou d'une ponctuation ouvrante
+                if not INITIAL_BREAK_PATTERN.match(text, match.end()):
+                    continue
+            elif word in PUNKT_ABBREVIATIONS or word.rsplit("-", 1)[-1] in PUNKT_ABBREVIATIONS:
+                continue # "mr." : un seul token non alphabétique pour NLTK
+            token = word
+        elif token[-1] == ".":
+            token = token[:-1]
+        if "'" in token:
+            token = CONTRACTION_SUFFIX_PATTERN.sub("", token)
+        elif token in TREEBANK_SPLIT_WORDS:
+            tokens.extend(TREEBANK_SPLIT_WORDS[token])
+            continue
+        tokens.append(token)
+    return tokens
+
+def tokenize_text(text):
+    """Tokens bruts (avant filtrage et lemmatisation) de text, selon TOKENIZER_MODE."""
+    if TOKENIZER_MODE == "regex":
+        return regex_tokenize(text.lower())
     # Utiliser les objets globaux définis ici
     # Mettre la tokenisation dans un try-except spécifique pour voir si c'est elle qui échoue
     try:
@@ -5004,10 +5270,162 @@ def preprocess_text(text):
     except Exception as e_tok_other:
          print(f"Erreur inattendue dans word_tokenize: {e_tok_other}")
          raise e_tok_other
+    return tokens
 
-    filtered_tokens = [lemmatizer_obj_global.lemmatize(w) for w in tokens if w.isalpha() and w not in stop_words_set_global]
-    return ' '.join(filtered_tokens)
-print("  Fonction preprocess_text définie.")
+def analyze_text(text):
+    """Termes analysés de text (tokens filtrés et racinisés), dans l'ordre du texte."""
+    if not isinstance(text, str): return []
+    return [lemma for lemma in map(normalize_token, tokenize_text(text)) if lemma]
+
+def preprocess_text(text):
+    return ' '.join(analyze_text(text))
+print(f"  Fonction preprocess_text définie (tokeniseur {TOKENIZER_MODE}, cache LRU de {TOKEN_CACHE_SIZE} tokens).")
+
+@lru_cache(maxsize=None)
+def analyzer_function(name):
+    """Fonction texte -> texte analysé de l'analyseur name du registre, avec son propre cache de tokens.
+
+    Sans effet sur l'analyseur de la session (ANALYZER_NAME, preprocess_text, table de lemmes, artefacts).
+    """
+    if name not in ANALYZERS:
+        raise ValueError(f"Analyseur inconnu: {name} (disponibles: {', '.join(ANALYZERS)})")
+    stem = TOKEN_STEMMERS[ANALYZERS[name]['analyzer']]
+    keep = TOKEN_FILTERS[ANALYZERS[name]['token_filter']]
+
+    @lru_cache(maxsize=TOKEN_CACHE_SIZE)
+    def normalize(token):
+        return stem(token) if keep(token) and token not in stop_words_set_global else ""
+
+    def analyze(text):
+        if not isinstance(text, str): return ""
+        return ' '.join(filter(None, map(normalize, tokenize_text(text))))
+    return analyze
+
+# --- Analyseur de l'index prétraité : "python" (preprocess_text, corpus réécrit puis --pretokenized) ou "lucene" ---
+# En mode "lucene", l'index prétraité est construit directement depuis le corpus de la cellule 0.4c avec
+# l'analyseur anglais d'Anserini (racinisation + liste de stopwords) ; la cellule 1.3 n'écrit plus de corpus
+# intermédiaire, et les recherches sur INDEX_DIR_PREPROC envoient la requête brute au même analyseur.
+PREPROC_ANALYZER = "python"
+LUCENE_STEMMER = "porter" # "porter", "krovetz" ou "none"
+LUCENE_STOPWORDS = "nltk" # "nltk" (stop_words_set_global), "lucene" (liste par défaut d'Anserini), "none" ou chemin d'un fichier
+
+def lucene_stopwords_path():
+    """Fichier de stopwords passé à Anserini (None : liste par défaut ou aucune liste)."""
+    if LUCENE_STOPWORDS in ("lucene", "none"):
+        return None
+    if LUCENE_STOPWORDS != "nltk":
+        return LUCENE_STOPWORDS
+    path = os.path.join(DRIVE_PROJECT_PATH, "analyzers", "stopwords_nltk.txt")
+    content = '\n'.join(sorted(stop_words_set_global)) + '\n'
+    if not os.path.exists(path) or open(path, 'r', encoding='utf-8').read() != content:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    return path
+
+def lucene_analyzer_args():
+    """Options d'analyse de pyserini.index.lucene correspondant à LUCENE_STEMMER / LUCENE_STOPWORDS."""
+    args = ["--stemmer", LUCENE_STEMMER]
+    if LUCENE_STOPWORDS == "none":
+        args.append("--keepStopwords")
+    stopwords_path = lucene_stopwords_path()
+    if stopwords_path:
+        args += ["--stopwords", stopwords_path]
+    return args
+
+def lucene_preproc_analyzer():
+    """Analyseur anglais d'Anserini configuré par LUCENE_STEMMER / LUCENE_STOPWORDS (objet Java)."""
+    from jnius import autoclass
+    DefaultEnglishAnalyzer = autoclass('io.anserini.analysis.DefaultEnglishAnalyzer')
+    return DefaultEnglishAnalyzer.fromArguments(LUCENE_STEMMER, LUCENE_STOPWORDS == "none", lucene_stopwords_path())
+
+def configure_searcher_analyzer(searcher, index_path):
+    """Donne au searcher de l'index prétraité l'analyseur utilisé à l'indexation (mode "lucene" uniquement)."""
+    if PREPROC_ANALYZER != "lucene" or os.path.abspath(index_path) != os.path.abspath(INDEX_DIR_PREPROC):
+        return
+    searcher.set_analyzer(lucene_preproc_analyzer())
+
+# --- Analyse Lucene par lots : chaque appel pyjnius est un aller-retour JNI ---
+# Les textes d'un lot sont joints par un mot sentinelle que l'analyseur laisse intact, analysés en un seul appel,
+# et la liste Java résultante revient en une seule chaîne (toString) au lieu d'un appel JNI par token.
+
+class LuceneBatchAnalyzer:
+    """Analyse de textes avec un analyseur Lucene : un texte par appel (analyze) ou par lots (analyze_batch)."""
+
+    SEPARATOR = "qqlotsepqq" # Ni mot vide, ni suffixe retiré par Porter/Krovetz, jamais découpé
+    _SEPARATOR_PATTERN = re.compile(rf"(?:(?<= )|^){SEPARATOR}(?= |$)")
+
+    def __init__(self, analyzer):
+        from jnius import autoclass
+        self.analyzer = analyzer
+        self._analyze = autoclass('io.anserini.analysis.AnalyzerUtils').analyze
+        if self.analyze(self.SEPARATOR) != [self.SEPARATOR]:
+            raise ValueError(f"L'analyseur modifie le séparateur de lots '{self.SEPARATOR}'.")
+
+    @staticmethod
+    def _java_list_tokens(java_list):
+        """Tokens d'une List<String> Java, transférés en une seule chaîne ("[a, b, c]")."""
+        content = java_list.toString()[1:-1]
+        return content.split(", ") if content else []
+
+    def analyze(self, text):
+        """Tokens d'un seul texte (un appel JNI pour l'analyse, un pour le transfert)."""
+        return self._java_list_tokens(self._analyze(self.analyzer, text))
+
+    def analyze_batch(self, texts):
+        """Tokens de chaque texte de la liste, avec deux appels JNI pour tout le lot."""
+        if not texts:
+            return []
+        joined = f" {self.SEPARATOR} ".join(texts)
+        analyzed = self._java_list_tokens(self._analyze(self.analyzer, joined))
+        parts = self._SEPARATOR_PATTERN.split(' '.join(analyzed))
+        if len(parts) != len(texts): # Séparateur absorbé par un texte inhabituel : repli texte par texte
+            return [self.analyze(text) for text in texts]
+        return [part.split() for part in parts]
+
+_lucene_batch_analyzer = None
+
+def lucene_batch_analyzer():
+    """LuceneBatchAnalyzer partagé, avec l'analyseur de l'index prétraité (créé au premier appel)."""
+    global _lucene_batch_analyzer
+    if _lucene_batch_analyzer is None:
+        _lucene_batch_analyzer = LuceneBatchAnalyzer(lucene_preproc_analyzer())
+    return _lucene_batch_analyzer
+print(f"  Analyseur de l'index prétraité: {PREPROC_ANALYZER}" + (f" (stemmer {LUCENE_STEMMER}, stopwords {LUCENE_STOPWORDS})." if PREPROC_ANALYZER == "lucene" else "."))
+
+# --- Artefacts par analyseur : corpus prétraité, index et requêtes rangés sous l'empreinte de l'analyseur ---
+# Sur le Drive, pour être réutilisés d'une session à l'autre : changer d'analyseur pointe vers un autre dossier,
+# et revenir à un analyseur déjà utilisé réutilise son corpus et son index (cellules 1.3 et 1.4).
+# Le corpus et l'index sont construits sur le disque local (OUTPUT_DIR, même arborescence) : le montage FUSE du
+# Drive est trop lent pour les écritures de Lucene et des shards. Ils sont copiés vers le Drive une fois leur
+# empreinte / manifeste écrit, et restaurés depuis le Drive en début de session s'ils y sont complets.
+ANALYZER_ARTIFACTS_DIR = os.path.join(DRIVE_PROJECT_PATH, "analyzer_artifacts")
+ANALYZER_WORK_DIRS = os.path.join(OUTPUT_DIR, "analyzer_artifacts")
+
+def analyzer_artifact_tag(tokenizer_mode=None):
+    """Nom du dossier d'artefacts : nom lisible de l'analyseur + empreinte de sa configuration complète."""
+    if PREPROC_ANALYZER == "lucene":
+        stopwords_path = lucene_stopwords_path()
+        stopwords_id = LUCENE_STOPWORDS
+        if stopwords_path:
+            with open(stopwords_path, 'rb') as f:
+                stopwords_id = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        config = {'analyzer': 'lucene', 'stemmer': LUCENE_STEMMER, 'stopwords': stopwords_id}
+        return f"lucene-{LUCENE_STEMMER}.{analyzer_config_fingerprint(config)}"
+    config = dict(ANALYZER_CONFIG, tokenizer=tokenizer_mode or TOKENIZER_MODE)
+    return f"{ANALYZER_NAME}.{analyzer_config_fingerprint(config)}"
+
+ANALYZER_TAG = analyzer_artifact_tag()
+ANALYZER_ARTIFACT_DIR = os.path.join(ANALYZER_ARTIFACTS_DIR, ANALYZER_TAG) # Copie persistante (Drive)
+ANALYZER_WORK_DIR = os.path.join(ANALYZER_WORK_DIRS, ANALYZER_TAG) # Construction (disque local)
+JSONL_PREPROC_DIR = os.path.join(ANALYZER_WORK_DIR, "corpus") # Shards prétraités (cellule 1.3)
+INDEX_DIR_PREPROC = os.path.join(ANALYZER_WORK_DIR, "index") # Remplace le dossier de la Partie 6 (cellule 1.4)
+JSONL_PREPROC_DRIVE_DIR = os.path.join(ANALYZER_ARTIFACT_DIR, "corpus")
+INDEX_DIR_PREPROC_DRIVE = os.path.join(ANALYZER_ARTIFACT_DIR, "index")
+QUERIES_PREPROC_PATH = os.path.join(ANALYZER_ARTIFACT_DIR, "queries.json") # Requêtes prétraitées (Partie 8)
+os.makedirs(ANALYZER_ARTIFACT_DIR, exist_ok=True)
+os.makedirs(ANALYZER_WORK_DIR, exist_ok=True)
+print(f"  Artefacts de l'analyseur: {ANALYZER_WORK_DIR} (copie persistante: {ANALYZER_ARTIFACT_DIR})")
 
 # --- Partie 8: Parsing des Topics ---
 print("\n[9/9] Parsing des topics...")
@@ -5056,10 +5474,32 @@ try:
     queries_long = {qid: data['title'] + " " + data['desc'] for qid, data in all_topics.items()}
     print(f"  {len(all_topics)} topics parsés.")
     print(f"  {len(queries_short)} requêtes courtes brutes créées.")
-    print(f"  Prétraitement des requêtes...")
-    queries_short_preprocessed = {qid: preprocess_text(q) for qid, q in queries_short.items()}
-    queries_long_preprocessed = {qid: preprocess_text(q) for qid, q in queries_long.items()}
-    print(f"  Prétraitement des requêtes terminé.")
+    if PREPROC_ANALYZER == "lucene":
+        # Requêtes brutes : l'analyseur Lucene de l'index prétraité les racinise au moment de la recherche
+        queries_short_preprocessed = dict(queries_short)
+        queries_long_preprocessed = dict(queries_long)
+        print(f"  Requêtes prétraitées = requêtes brutes (analyseur Lucene).")
+    else:
+        # Réutiliser les requêtes déjà prétraitées par cet analyseur si les topics n'ont pas changé
+        topics_hash = analyzer_config_fingerprint({'short': queries_short, 'long': queries_long})
+        cached_queries = None
+        if os.path.exists(QUERIES_PREPROC_PATH):
+            with open(QUERIES_PREPROC_PATH, 'r', encoding='utf-8') as f:
+                cached_queries = json.load(f)
+        if cached_queries is not None and cached_queries.get('topics_hash') == topics_hash:
+            queries_short_preprocessed = cached_queries['short']
+            queries_long_preprocessed = cached_queries['long']
+            print(f"  Requêtes prétraitées rechargées depuis {QUERIES_PREPROC_PATH}.")
+        else:
+            print(f"  Prétraitement des requêtes...")
+            queries_short_preprocessed = {qid: preprocess_text(q) for qid, q in queries_short.items()}
+            queries_long_preprocessed = {qid: preprocess_text(q) for qid, q in queries_long.items()}
+            cache_stats = token_cache_stats()
+            print(f"  Prétraitement des requêtes terminé (cache tokens: {cache_stats['hits']} hits, {cache_stats['misses']} misses).")
+            print(f"  Table de lemmes: {stem_table.save()} nouvelles entrées enregistrées.")
+            with open(QUERIES_PREPROC_PATH, 'w', encoding='utf-8') as f:
+                json.dump({'topics_hash': topics_hash, 'short': queries_short_preprocessed,
+                           'long': queries_long_preprocessed}, f, ensure_ascii=False)
 except Exception as e_preproc_queries:
      print(f"\nERREUR lors du prétraitement des requêtes: {e_preproc_queries}")
      print("Les dictionnaires prétraités pourraient être incomplets ou vides.")
@@ -5237,15 +5677,1585 @@ if os.path.exists(JSONL_OUTPUT_PATH):
     elif output_size > 0 and doc_count > 0:
          print("  SUCCÈS: Le fichier de sortie contient des données.")
 
+# === Cellule 0.4a: Scanner SGML TREC (une passe sur les octets) ===
+# Remplace les trois regex DOTALL (doc_pattern / docno_pattern / text_pattern) :
+# les frontières DOC/DOCNO/TEXT sont repérées avec bytes.find sur le contenu décompressé,
+# sans décoder tout le membre en str ni copier chaque <DOC>. Tous les blocs <TEXT> d'un
+# document sont concaténés (la regex d'origine ne gardait que le premier).
+import re
+import time
+
+class TrecSgmlScanner:
+    """Scanner incrémental de documents TREC SGML travaillant sur des octets."""
+
+    # Séparateurs que str.split() reconnaît mais pas bytes.split()
+    _STR_ONLY_SEPARATORS = re.compile(rb"[\x1c-\x1f]")
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.doc_count = 0
+
+    def scan(self, data, start=0, end=None):
+        """Parcourt data (bytes/bytearray) et retourne (docno, texte) pour chaque <DOC> complet."""
+        for doc, _ in self._scan_with_offsets(data, start, len(data) if end is None else end):
+            yield doc
+
+    def feed(self, chunk):
+        """Ajoute un bloc d'octets et retourne la liste des documents devenus complets."""
+        buf = self._buffer
+        buf += chunk
+        docs = []
+        consumed = 0
+        for doc, consumed in self._scan_with_offsets(buf, 0, len(buf)):
+            docs.append(doc)
+        if consumed:
+            del buf[:consumed] # Seul le <DOC> en cours reste en mémoire
+        elif buf.find(b"<DOC>") == -1 and len(buf) > 5:
+            del buf[:-5] # Aucun <DOC> ouvert : garder juste de quoi reconnaître une balise coupée
+        return docs
+
+    def close(self):
+        """Termine le flux ; un <DOC> non fermé est ignoré (comme avec la regex)."""
+        self._buffer.clear()
+
+    def _scan_with_offsets(self, data, pos, end):
+        find = data.find
+        while True:
+            doc_start = find(b"<DOC>", pos, end)
+            if doc_start == -1:
+                return
+            doc_end = find(b"</DOC>", doc_start + 5, end)
+            if doc_end == -1:
+                return # Document incomplet : on attend la suite du flux
+            pos = doc_end + 6
+            parsed = self._parse_doc(data, doc_start + 5, doc_end)
+            if parsed is not None:
+                self.doc_count += 1
+                yield parsed, pos
+
+    def _parse_doc(self, data, start, end):
+        find = data.find
+        docno_start = find(b"<DOCNO>", start, end)
+        if docno_start == -1:
+            return None
+        docno_end = find(b"</DOCNO>", docno_start + 7, end)
+        if docno_end == -1:
+            return None
+        docno = bytes(data[docno_start + 7:docno_end]).strip().decode('utf-8', errors='ignore')
+        tokens = []
+        text_start = find(b"<TEXT>", docno_end, end)
+        while text_start != -1:
+            text_end = find(b"</TEXT>", text_start + 6, end)
+            if text_end == -1:
+                break
+            # Une seule copie par bloc <TEXT> (le <DOC> entier n'est jamais copié ni décodé)
+            tokens.extend(data[text_start + 6:text_end].split())
+            text_start = find(b"<TEXT>", text_end + 7, end)
+        text_bytes = b" ".join(tokens)
+        if text_bytes.isascii() and not self._STR_ONLY_SEPARATORS.search(text_bytes):
+            return docno, text_bytes.decode('ascii')
+        # Octets non ASCII : retomber sur la normalisation str pour rester identique à la cellule 0.4
+        return docno, ' '.join(text_bytes.decode('utf-8', errors='ignore').split())
+
+def regex_parse_member(content_bytes):
+    """Chemin de référence (cellule 0.4) : décodage str puis trois regex DOTALL."""
+    content = content_bytes.decode('utf-8', errors='ignore')
+    docs = []
+    for doc_content in re.findall(r"<DOC>(.*?)</DOC>", content, re.DOTALL):
+        docno_match = re.search(r"<DOCNO>\s*(.*?)\s*</DOCNO>", doc_content)
+        if not docno_match:
+            continue
+        text_match = re.search(r"<TEXT>(.*?)</TEXT>", doc_content, re.DOTALL)
+        doc_text = ' '.join(text_match.group(1).strip().split()) if text_match else ""
+        docs.append((docno_match.group(1).strip(), doc_text))
+    return docs
+
+def benchmark_sgml_scanner(member_contents, repeat=3):
+    """Compare le scanner et le chemin regex sur les mêmes contenus décompressés (liste de bytes)."""
+    total_bytes = sum(len(c) for c in member_contents)
+    timings = {}
+    for name, parse in (("regex", regex_parse_member), ("scanner", lambda c: list(TrecSgmlScanner().scan(c)))):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = [parse(c) for c in member_contents]
+            best = min(best, time.perf_counter() - start)
+        timings[name] = (best, results)
+    regex_docs = [d for r in timings["regex"][1] for d in r]
+    scanner_docs = [d for r in timings["scanner"][1] for d in r]
+    # Les seules différences attendues : documents à plusieurs <TEXT> (le scanner les concatène)
+    differing = sum(1 for a, b in zip(regex_docs, scanner_docs) if a != b)
+    speedup = timings["regex"][0] / timings["scanner"][0] if timings["scanner"][0] > 0 else float('inf')
+    print(f"  {len(member_contents)} membres, {total_bytes / 1e6:.1f} Mo décompressés, {len(scanner_docs)} documents")
+    print(f"  Regex   : {timings['regex'][0]:.3f} s ({total_bytes / 1e6 / timings['regex'][0]:.1f} Mo/s)")
+    print(f"  Scanner : {timings['scanner'][0]:.3f} s ({total_bytes / 1e6 / timings['scanner'][0]:.1f} Mo/s)")
+    print(f"  Accélération: x{speedup:.2f} | documents différents (multi-<TEXT>): {differing}")
+    return {'regex_sec': timings["regex"][0], 'scanner_sec': timings["scanner"][0], 'speedup': speedup,
+            'docs': len(scanner_docs), 'docs_differing': differing}
+
+print("Scanner SGML TREC défini.")
+
+# === Cellule 0.4b: Moteur d'Extraction en Streaming (sans tar.getmembers) ===
+# Parcourt AP.tar en lecture séquentielle (mode "r|*") : TarFile.next() ajoute chaque TarInfo à tar.members
+# même en flux, la liste est donc vidée après chaque membre ; chaque membre .gz est décompressé au fil de l'eau
+# et chaque <DOC> est émis dès qu'il est complet.
+# On ne garde donc en mémoire qu'un seul document à la fois (au lieu de l'archive + du texte décompressé).
+# Mode parallèle : le processus principal lit les membres bruts, un Pool décompresse et parse,
+# et le processus principal (seul écrivain) écrit le JSONL dans l'ordre de l'archive.
+# Le parsing utilise TrecSgmlScanner (cellule 0.4a) dans les deux modes.
+# Shards : la sortie est répartie en N fichiers équilibrés (ap_docs/ap_docs.00.jsonl ... ap_docs.NN.jsonl)
+# pour que JsonCollection indexe un fichier par thread. Chaque membre va dans le shard le moins rempli.
+# Reprise : après chaque membre, une ligne est ajoutée au manifeste (ap_docs.checkpoint, JSON par ligne)
+# avec la position dans l'archive et la taille de chaque shard. Au redémarrage, les shards sont tronqués
+# au dernier point de contrôle et la lecture de l'archive reprend au membre suivant.
+# La même ligne décrit le membre (shard, plage d'octets, hachage du JSONL, docnos) : les mises à jour
+# incrémentales des index comparent ces membres sans relire le corpus.
+# Le manifeste et l'empreinte sont écrits à côté du dossier des shards pour que JsonCollection ne les indexe pas.
+# Empreinte : en fin d'extraction, ap_docs.fingerprint enregistre taille, mtime et hachage rapide
+# de AP.tar avec EXTRACTOR_VERSION ; si rien n'a changé, la cellule 0.4c saute toute l'extraction.
+# Mode "trec" : unpack_ap_members copie les membres en .gz (ap_trec/) pour TrecCollection, sans JSONL intermédiaire.
+# Indexation en flux : avec document_sink=StreamingLuceneIndexer(...), les documents extraits sont indexés
+# dans le même processus (LuceneIndexer de Pyserini) au lieu d'attendre la fin du JSONL puis la cellule 1.2.
+# Membres .Z (Unix compress) : décodés par gzip -dc (décodeur natif, qui lit aussi le format compress) s'il est
+# installé, sinon en flux par LzwDecompressor (LZW pur Python, environ 5 Mo/s, nettement plus lent que gzip -dc).
+# Compression (optionnelle) : shards .jsonl.gz (zlib) ou .jsonl.zst (zstandard), écrits en flux ;
+# open_corpus_reader / open_corpus_writer lisent et écrivent ces fichiers ligne à ligne sans décompression sur disque.
+import tarfile
+import json
+import gzip
+import hashlib
+import glob
+import codecs
+import io
+import os
+import re
+import shutil
+import subprocess
+import threading
+import zlib
+import time
+import traceback
+from collections import Counter, deque
+from functools import lru_cache
+from multiprocessing import Pool
+from tqdm.notebook import tqdm
+
+STREAM_READ_SIZE = 1 << 16 # Taille des blocs décompressés passés au scanner
+STREAM_INDEX_BATCH_SIZE = 2000 # Documents par appel add_batch_raw (indexation en flux)
+# Profils d'index : options de stockage Anserini, du moins coûteux au plus complet (chacun inclut le précédent)
+INDEX_PROFILES = {
+    "minimal": [], # Postings, fréquences et normes : BM25, QLD, TF-IDF
+    "prf": ["--storeDocvectors"], # + vecteurs de documents : RM3 / Rocchio (set_rm3)
+    "full": ["--storePositions", "--storeDocvectors", "--storeRaw"], # + positions (phrases) et texte brut
+}
+# Besoins déclarés par les cellules de recherche ; les index sont construits avec le profil le moins coûteux qui les couvre
+SEARCH_INDEX_NEEDS = {
+    "BM25 / TF-IDF (cellules 3.1 et 5)": "minimal",
+    "BM25 / QLD (cellule 4)": "minimal",
+    "RM3 (cellule 7)": "prf",
+}
+# Composants d'un index Lucene par extension de fichier (rapport de taille des profils)
+LUCENE_FILE_COMPONENTS = {
+    '.doc': 'postings', '.pos': 'positions', '.pay': 'positions',
+    '.tim': 'terms', '.tip': 'terms', '.tmd': 'terms',
+    '.tvd': 'docvectors', '.tvx': 'docvectors', '.tvm': 'docvectors',
+    '.fdt': 'stored', '.fdx': 'stored', '.fdm': 'stored',
+    '.nvd': 'norms', '.nvm': 'norms', '.dvd': 'docvalues', '.dvm': 'docvalues',
+    '.kdd': 'points', '.kdi': 'points', '.kdm': 'points',
+    '.cfs': 'compound', '.cfe': 'compound',
+}
+EXTRACTOR_VERSION = "0.4b-scanner-2" # À incrémenter dès que le format ou le contenu du JSONL change
+
+CORPUS_SUFFIXES = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+def shard_paths(output_dir, n_shards, compression=None):
+    """Chemins des shards : <dossier>/<nom du dossier>.00.jsonl[.gz|.zst], .01.jsonl[.gz|.zst], ..."""
+    if compression not in CORPUS_SUFFIXES:
+        raise ValueError(f"Compression inconnue: {compression!r} (attendu: None, 'gzip' ou 'zstd')")
+    base_name = os.path.basename(os.path.normpath(output_dir))
+    suffix = CORPUS_SUFFIXES[compression]
+    return [os.path.join(output_dir, f"{base_name}.{i:02d}{suffix}") for i in range(n_shards)]
+
+def corpus_compression(path):
+    """Compression d'un fichier corpus d'après son extension (None, 'gzip' ou 'zstd')."""
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+def import_zstandard():
+    """Import paresseux de zstandard (optionnel, seulement pour les corpus .jsonl.zst)."""
+    try:
+        import zstandard
+    except ImportError as e_import:
+        print("ERREUR: le module 'zstandard' est requis pour les corpus .jsonl.zst (pip install zstandard).")
+        raise e_import
+    return zstandard
+
+def new_member_compressor(compression):
+    """Compresseur d'un bloc indépendant : un membre gzip ou une frame zstd, décodable par concaténation."""
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31 : en-tête et CRC gzip
+    if compression == "zstd":
+        return import_zstandard().ZstdCompressor(level=3).compressobj()
+    return None
+
+def open_corpus_reader(path):
+    """Ouvre un fichier corpus JSONL en lecture texte (streaming), compressé ou non."""
+    compression = corpus_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, 'rt', encoding='utf-8') # Lit tous les membres gzip concaténés
+    if compression == "zstd":
+        raw = open(path, 'rb')
+        reader = import_zstandard().ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def open_corpus_writer(path):
+    """Ouvre un fichier corpus JSONL en écriture texte (streaming), compressé selon son extension."""
+    compression = corpus_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == "zstd":
+        raw = open(path, 'wb')
+        writer = import_zstandard().ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+CORPUS_STAGING_DIR = os.path.join(OUTPUT_DIR, "staging") # Shards .zst décompressés pour l'indexation (disque local)
+
+def stage_corpus_for_indexing(input_dir, staging_dir=None):
+    """Dossier à passer à --input : JsonCollection lit .jsonl et .jsonl.gz, mais pas .jsonl.zst.
+
+    Les shards .zst sont décompressés en flux vers staging_dir (par défaut un dossier propre à input_dir sous
+    CORPUS_STAGING_DIR, sur le disque local même si input_dir est sur le Drive) ; sinon input_dir est retourné tel quel.
+    """
+    zst_paths = sorted(glob.glob(os.path.join(input_dir, "*.jsonl.zst")))
+    if not zst_paths:
+        return input_dir
+    if staging_dir is None:
+        input_key = hashlib.blake2b(os.path.abspath(input_dir).encode('utf-8'), digest_size=4).hexdigest()
+        staging_dir = os.path.join(CORPUS_STAGING_DIR, f"{os.path.basename(os.path.normpath(input_dir))}.{input_key}")
+    os.makedirs(staging_dir, exist_ok=True)
+    for old_path in glob.glob(os.path.join(staging_dir, "*.jsonl*")):
+        os.remove(old_path)
+    decompressor = import_zstandard().ZstdDecompressor()
+    for zst_path in zst_paths:
+        staged_path = os.path.join(staging_dir, os.path.basename(zst_path)[:-len(".zst")])
+        with open(zst_path, 'rb') as src, open(staged_path, 'wb') as dst:
+            decompressor.copy_stream(src, dst, read_across_frames=True)
+    print(f"  {len(zst_paths)} shards .zst décompressés dans {staging_dir} pour l'indexation.")
+    return staging_dir
+
+class ShardedJsonlWriter:
+    """Écrit des blocs JSONL (octets) dans N shards en équilibrant leur taille.
+
+    Avec compression, chaque membre de l'archive devient un membre gzip / une frame zstd complète :
+    les offsets des points de contrôle restent des frontières valides pour la reprise.
+    """
+
+    def __init__(self, paths, offsets=None, compression=None):
+        self.paths = paths
+        self.compression = compression
+        self.compressor = None
+        if offsets is None:
+            self.files = [open(path, 'wb') for path in paths]
+        else:
+            # Reprise : chaque shard est tronqué à la position du dernier point de contrôle
+            self.files = [open(path, 'r+b') for path in paths]
+            for f, offset in zip(self.files, offsets):
+                f.truncate(offset)
+                f.seek(offset)
+        self.sizes = [f.tell() for f in self.files]
+        self.current = 0
+
+    def start_member(self):
+        """Choisit le shard le moins rempli pour le membre suivant (un membre n'est jamais coupé)."""
+        self.current = self.sizes.index(min(self.sizes))
+        self.member_offset = self.sizes[self.current]
+        self.member_digest = hashlib.blake2b(digest_size=16) # Hachage du JSONL du membre (avant compression)
+        self.compressor = new_member_compressor(self.compression)
+
+    def _write_raw(self, data):
+        self.files[self.current].write(data)
+        self.sizes[self.current] += len(data)
+
+    def write(self, data):
+        self.member_digest.update(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self._write_raw(data)
+
+    def end_member(self):
+        """Termine le membre gzip / la frame zstd en cours (à appeler avant chaque point de contrôle)."""
+        if self.compressor is not None:
+            self._write_raw(self.compressor.flush())
+            self.compressor = None
+
+    def offsets(self):
+        for f in self.files:
+            f.flush()
+        return [f.tell() for f in self.files]
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fingerprint_archive(tar_path, sample_blocks=64, block_size=1 << 16):
+    """Empreinte rapide de l'archive : taille, mtime et BLAKE2b de blocs répartis sur tout le fichier."""
+    size = os.path.getsize(tar_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(tar_path, 'rb') as fh:
+        # Quelques Mo lus au lieu de l'archive entière (Drive est le maillon lent)
+        step = max(block_size, size // sample_blocks)
+        for offset in list(range(0, size, step)) + [max(0, size - block_size)]:
+            fh.seek(offset)
+            digest.update(fh.read(block_size))
+    return {'archive_size': size, 'archive_mtime_ns': os.stat(tar_path).st_mtime_ns,
+            'archive_hash': digest.hexdigest(), 'extractor_version': EXTRACTOR_VERSION}
+
+def same_archive(record, fingerprint):
+    """True si record (manifeste ou empreinte) a été produit à partir de la même archive et du même extracteur."""
+    return all(record.get(key) == value for key, value in fingerprint.items())
+
+def extraction_identity(tar_path, n_shards, compression=None):
+    """Ce qui doit être identique pour réutiliser (ou reprendre) une extraction : archive, extracteur, shards, compression."""
+    return dict(fingerprint_archive(tar_path), shards=n_shards, compression=compression)
+
+def load_extraction_fingerprint(output_dir):
+    """Retourne l'empreinte enregistrée à côté du dossier des shards (ou None)."""
+    fingerprint_path = os.path.normpath(output_dir) + ".fingerprint"
+    if not os.path.exists(fingerprint_path):
+        return None
+    try:
+        with open(fingerprint_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+def is_extraction_up_to_date(tar_path, output_dir, n_shards, compression=None):
+    """True si les shards existent, sont complets et proviennent de la même archive et du même extracteur."""
+    record = load_extraction_fingerprint(output_dir)
+    if record is None:
+        return False, record
+    paths = shard_paths(output_dir, n_shards, compression)
+    if not all(os.path.exists(path) for path in paths):
+        return False, record
+    if [os.path.getsize(path) for path in paths] != record.get('output_sizes'):
+        return False, record
+    return same_archive(record, extraction_identity(tar_path, n_shards, compression)), record
+
+def write_extraction_fingerprint(tar_path, output_dir, n_shards, stats, compression=None):
+    """Enregistre l'empreinte de l'archive une fois l'extraction terminée."""
+    record = dict(extraction_identity(tar_path, n_shards, compression),
+                  output_sizes=[os.path.getsize(path) for path in shard_paths(output_dir, n_shards, compression)],
+                  doc_count=stats['doc_count'], completed_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(os.path.normpath(output_dir) + ".fingerprint", 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    return record
+
+def is_plain_tar(tar_path):
+    """True si l'archive n'est pas compressée (on peut alors reprendre par seek direct)."""
+    with open(tar_path, 'rb') as fh:
+        magic = fh.read(6)
+    return not (magic.startswith(b"\x1f\x8b") or magic.startswith(b"BZh") or magic.startswith(b"\xfd7zXZ"))
+
+def iter_tar_members_stream(tar_path, start_offset=0, skip_members=0, first_index=0):
+    """Parcourt l'archive séquentiellement et retourne (membre, fichier, position) pour chaque fichier régulier.
+
+    position = {'member_index': ..., 'tar_offset': ...} désigne le point de reprise APRÈS ce membre.
+    start_offset (archive non compressée, first_index = membres déjà lus) ou skip_members
+    (archive compressée) permettent de reprendre.
+    """
+    with open(tar_path, 'rb') as fh:
+        fh.seek(start_offset)
+        # "r|*" : lecture en flux, pas de seek
+        with tarfile.open(fileobj=fh, mode="r|*") as tar:
+            member_index = first_index
+            while True:
+                member = tar.next()
+                if member is None:
+                    break
+                tar.members.clear() # next() garde chaque TarInfo dans tar.members, même en mode flux
+                if not member.isfile():
+                    continue
+                member_index += 1
+                if member_index <= skip_members:
+                    continue
+                position = {'member_index': member_index,
+                            'tar_offset': start_offset + member.offset_data + ((member.size + 511) // 512) * 512}
+                # extractfile() n'est valide que pour le membre courant en mode flux
+                yield member, tar.extractfile(member), position
+
+LZW_MAGIC = b"\x1f\x9d"
+LZW_NATIVE_DECODER = shutil.which("gzip") # gzip -dc décode aussi les .Z ; None : LzwDecompressor (pur Python, ~5 Mo/s)
+LZW_BLOCK_MODE = 0x80 # Bit du 3e octet : le code 256 (CLEAR) réinitialise la table
+LZW_CLEAR = 256
+
+class BadLzwFile(OSError):
+    """Membre .Z illisible (en-tête invalide ou code LZW hors table)."""
+
+class LzwDecompressor:
+    """Décompresseur LZW incrémental au format Unix compress (.Z), même interface que zlib.decompressobj.
+
+    Les codes (9 à maxbits bits, poids faible d'abord) sont lus par groupes de 8 codes, soit n_bits octets :
+    compress saute la fin du groupe en cours à chaque changement de largeur et après un CLEAR.
+    Repli quand gzip n'est pas installé : en pur Python, le décodage plafonne vers 5 Mo/s.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.header_read = False
+        self.eof = False
+
+    def _read_header(self):
+        if self.buffer[:2] != LZW_MAGIC:
+            raise BadLzwFile("En-tête .Z invalide (magic 1f 9d attendu)")
+        flags = self.buffer[2]
+        self.maxbits = flags & 0x1f
+        if not 9 <= self.maxbits <= 16:
+            raise BadLzwFile(f"Largeur de code .Z non supportée: {self.maxbits} bits")
+        self.block_mode = bool(flags & LZW_BLOCK_MODE)
+        self.maxmaxcode = 1 << self.maxbits
+        self.table = [bytes([i]) for i in range(256)] + [b""] * (self.maxmaxcode + 1 - 256)
+        self.n_bits = 9
+        self.maxcode = (1 << 9) - 1
+        self.free_ent = LZW_CLEAR + 1 if self.block_mode else LZW_CLEAR
+        self.previous = None # Chaîne décodée du code précédent (None avant le premier code)
+        self.buffer = self.buffer[3:]
+        self.header_read = True
+
+    def decompress(self, data):
+        """Retourne les octets décodés de data ; les groupes de codes incomplets sont gardés pour l'appel suivant."""
+        self.buffer += data
+        if not self.header_read:
+            if len(self.buffer) < 3:
+                return b""
+            self._read_header()
+        return self._decode(final=False)
+
+    def flush(self):
+        """Décode le dernier groupe (incomplet) ; à appeler une fois toute l'entrée fournie."""
+        if not self.header_read:
+            if self.buffer:
+                raise EOFError("Membre .Z tronqué (en-tête incomplet)")
+            self.eof = True
+            return b""
+        output = self._decode(final=True)
+        self.eof = True
+        return output
+
+    def _decode(self, final):
+        buffer, table, output = self.buffer, self.table, []
+        n_bits, maxcode, free_ent, previous = self.n_bits, self.maxcode, self.free_ent, self.previous
+        maxbits, maxmaxcode, block_mode = self.maxbits, self.maxmaxcode, self.block_mode
+        pos, size = 0, len(self.buffer)
+        while True:
+            if free_ent > maxcode:
+                n_bits += 1
+                maxcode = maxmaxcode if n_bits == maxbits else (1 << n_bits) - 1
+            if size - pos >= n_bits:
+                count = 8
+            elif final and size > pos:
+                count = (size - pos) * 8 // n_bits # Dernier groupe : seulement les codes complets
+            else:
+                break
+            value = int.from_bytes(buffer[pos:pos + n_bits], 'little')
+            pos += n_bits
+            mask = (1 << n_bits) - 1
+            for i in range(count):
+                if i and free_ent > maxcode:
+                    break # Changement de largeur : le reste du groupe est du bourrage
+                code = (value >> (i * n_bits)) & mask
+                if previous is None:
+                    if code >= 256:
+                        raise BadLzwFile(f"Premier code .Z invalide: {code}")
+                    previous = table[code]
+                    output.append(previous)
+                    continue
+                if code == LZW_CLEAR and block_mode:
+                    free_ent = LZW_CLEAR # L'entrée 256 est réécrite (jamais lue) au code suivant, comme dans compress
+                    n_bits, maxcode = 9, (1 << 9) - 1
+                    break
+                if code < free_ent:
+                    entry = table[code]
+                elif code == free_ent:
+                    entry = previous + previous[:1] # Cas KwKwK : le code est celui qu'on va créer
+                else:
+                    raise BadLzwFile(f"Code .Z hors table: {code} (prochaine entrée {free_ent})")
+                output.append(entry)
+                if free_ent < maxmaxcode:
+                    table[free_ent] = previous + entry[:1]
+                    free_ent += 1
+                previous = entry
+        self.buffer = buffer[pos:]
+        self.n_bits, self.maxcode, self.free_ent, self.previous = n_bits, maxcode, free_ent, previous
+        return b"".join(output)
+
+def lzw_decompress(data):
+    """Décompresse en une fois le contenu d'un fichier .Z (gzip -dc si disponible, sinon LzwDecompressor)."""
+    if LZW_NATIVE_DECODER:
+        result = subprocess.run([LZW_NATIVE_DECODER, "-dc"], input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if result.returncode == 0:
+            return result.stdout
+        # Membre refusé par gzip : le décodeur Python donne le diagnostic (BadLzwFile / EOFError)
+    decompressor = LzwDecompressor()
+    return decompressor.decompress(data) + decompressor.flush()
+
+class LzwReader(io.RawIOBase):
+    """Flux binaire lisible qui décompresse un membre .Z à la volée (équivalent de gzip.GzipFile en lecture)."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decompressor = LzwDecompressor()
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending and not self.decompressor.eof:
+            chunk = self.fileobj.read(STREAM_READ_SIZE)
+            self.pending = self.decompressor.decompress(chunk) if chunk else self.decompressor.flush()
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+class NativeLzwReader(io.RawIOBase):
+    """Flux binaire lisible qui décompresse un membre .Z par gzip -dc, alimenté par un thread (même rôle que LzwReader)."""
+
+    def __init__(self, fileobj):
+        self.process = subprocess.Popen([LZW_NATIVE_DECODER, "-dc"], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.feeder = threading.Thread(target=self._feed, args=(fileobj,), daemon=True)
+        self.feeder.start()
+
+    def _feed(self, fileobj):
+        try:
+            while True:
+                chunk = fileobj.read(STREAM_READ_SIZE)
+                if not chunk:
+                    break
+                self.process.stdin.write(chunk)
+            self.process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass # gzip arrêté (membre corrompu) ou flux fermé avant la fin de la lecture
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.process.stdout.readinto(b)
+        if n == 0:
+            self.feeder.join()
+            if self.process.wait() != 0:
+                raise BadLzwFile(f"Membre .Z illisible ou tronqué (gzip -dc, code {self.process.returncode})")
+        return n
+
+    def close(self):
+        """Arrête gzip et attend le thread : le membre suivant de l'archive ne doit pas être lu en même temps."""
+        if not self.closed:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.feeder.join()
+            self.process.wait()
+            self.process.stdout.close()
+        super().close()
+
+def decompress_member(raw_bytes):
+    """Décompresse un membre d'après son magic (gzip ou .Z). Retourne (octets, reconnu)."""
+    if raw_bytes[:2] == b"\x1f\x8b":
+        return gzip.decompress(raw_bytes), True
+    if raw_bytes[:2] == LZW_MAGIC:
+        return lzw_decompress(raw_bytes), True
+    return raw_bytes, False # Même repli que la cellule 0.4 : lecture directe
+
+def open_member_stream(member_file):
+    """Retourne un flux décompressé (gzip ou .Z) ou brut, plus un booléen indiquant si la compression est reconnue."""
+    magic = member_file.peek(2)[:2]
+    if magic == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=member_file, mode="rb"), True
+    if magic == LZW_MAGIC:
+        reader = NativeLzwReader(member_file) if LZW_NATIVE_DECODER else LzwReader(member_file)
+        return io.BufferedReader(reader, STREAM_READ_SIZE), True
+    # Même comportement que la cellule 0.4 : lecture directe si ce n'est pas du gzip
+    return member_file, False
+
+def iter_docs_stream(stream):
+    """Lit un flux par blocs et retourne (docno, texte) dès qu'un </DOC> est atteint."""
+    scanner = TrecSgmlScanner()
+    while True:
+        chunk = stream.read(STREAM_READ_SIZE)
+        if not chunk:
+            break
+        yield from scanner.feed(chunk) # Le scanner ne garde que le <DOC> en cours
+    scanner.close()
+
+def load_extraction_checkpoint(output_dir, tar_path, n_shards, compression=None):
+    """Lit le manifeste de reprise et retourne le dernier point de contrôle valide (ou None)."""
+    manifest_path = os.path.normpath(output_dir) + ".checkpoint"
+    paths = shard_paths(output_dir, n_shards, compression)
+    if not os.path.exists(manifest_path) or not all(os.path.exists(path) for path in paths):
+        return None
+    output_sizes = [os.path.getsize(path) for path in paths]
+    header, last_valid = None, None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Ligne tronquée par une interruption
+            if header is None:
+                header = entry
+                continue
+            # Ignorer un point de contrôle qui pointerait au-delà des données réellement écrites
+            if all(offset <= size for offset, size in zip(entry['output_offsets'], output_sizes)):
+                last_valid = entry
+    if header is None or not same_archive(header, extraction_identity(tar_path, n_shards, compression)):
+        print("  Manifeste de reprise incompatible avec l'archive ou l'extracteur actuels, extraction complète.")
+        return None
+    return last_valid
+
+def open_extraction_output(output_dir, tar_path, n_shards, resume=True, compression=None):
+    """Ouvre les shards de sortie et le manifeste, en tronquant la fin partielle si on reprend.
+
+    Retourne (writer, manifest_file, checkpoint) ; checkpoint vaut None pour une extraction complète.
+    """
+    manifest_path = os.path.normpath(output_dir) + ".checkpoint"
+    fingerprint_path = os.path.normpath(output_dir) + ".fingerprint"
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path) # Les shards ne sont plus considérés complets tant que l'extraction tourne
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = load_extraction_checkpoint(output_dir, tar_path, n_shards, compression) if resume else None
+    paths = shard_paths(output_dir, n_shards, compression)
+    if checkpoint is None:
+        # Supprimer les shards d'une extraction précédente (un autre N laisserait des fichiers en trop)
+        for old_path in glob.glob(os.path.join(output_dir, "*.jsonl*")):
+            os.remove(old_path)
+        writer = ShardedJsonlWriter(paths, compression=compression)
+        manifest_file = open(manifest_path, 'w', encoding='utf-8')
+        manifest_file.write(json.dumps(dict(extraction_identity(tar_path, n_shards, compression), archive=os.path.basename(tar_path))) + '\n')
+        manifest_file.flush()
+        return writer, manifest_file, None
+    writer = ShardedJsonlWriter(paths, offsets=checkpoint['output_offsets'], compression=compression) # Supprime les lignes du membre interrompu
+    manifest_file = open(manifest_path, 'a', encoding='utf-8')
+    if os.path.getsize(manifest_path) > 0:
+        with open(manifest_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                manifest_file.write('\n') # Isoler la ligne tronquée des points de contrôle suivants
+    print(f"  Reprise après le membre {checkpoint['member']} ({checkpoint['member_index']} membres, "
+          f"{checkpoint['doc_total']} documents déjà extraits).")
+    return writer, manifest_file, checkpoint
+
+def record_member_checkpoint(writer, manifest_file, member_name, position, stats, docnos):
+    """Enregistre un point de contrôle après l'écriture complète d'un membre (membre compressé terminé).
+
+    La ligne décrit aussi le membre (shard, offset de début, hachage du JSONL, docnos) : load_member_manifest
+    s'en sert pour les mises à jour incrémentales des index.
+    """
+    writer.end_member()
+    manifest_file.write(json.dumps({'member': member_name, 'member_index': position['member_index'],
+                                    'tar_offset': position['tar_offset'], 'output_offsets': writer.offsets(),
+                                    'doc_total': stats['doc_count'], 'shard': writer.current,
+                                    'offset': writer.member_offset, 'digest': writer.member_digest.hexdigest(),
+                                    'docnos': docnos}) + '\n')
+    manifest_file.flush()
+
+def load_member_manifest(output_dir):
+    """Membres d'une extraction terminée, dans l'ordre de l'archive, d'après son manifeste de reprise.
+
+    Chaque entrée donne le shard ('path'), la plage d'octets du membre ('offset' -> output_offsets[shard]),
+    le hachage de son JSONL et ses docnos. Retourne None si l'extraction n'est pas terminée ou si le manifeste
+    ne décrit pas les membres (extracteur antérieur).
+    """
+    record = load_extraction_fingerprint(output_dir)
+    manifest_path = os.path.normpath(output_dir) + ".checkpoint"
+    if record is None or not os.path.exists(manifest_path):
+        return None
+    entries = {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        next(f, None) # En-tête : identité de l'archive
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Ligne tronquée par une interruption
+            entries[entry['member_index']] = entry # Après une reprise, la dernière écriture d'un membre l'emporte
+    members = [entries[index] for index in sorted(entries)]
+    if (not members or any('digest' not in entry for entry in members)
+            or members[-1]['output_offsets'] != record.get('output_sizes')
+            or len({entry['member'] for entry in members}) != len(members)):
+        return None
+    paths = shard_paths(output_dir, record['shards'], record.get('compression'))
+    for entry in members:
+        entry['path'] = paths[entry['shard']]
+    return members
+
+def read_member_lines(entry):
+    """Lignes JSONL d'un membre, lues dans sa seule plage d'octets du shard (un membre gzip / une frame zstd)."""
+    with open(entry['path'], 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['output_offsets'][entry['shard']] - entry['offset'])
+    compression = corpus_compression(entry['path'])
+    if compression == "gzip":
+        data = gzip.decompress(data)
+    elif compression == "zstd":
+        data = import_zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    return data.decode('utf-8').splitlines()
+
+def resume_arguments(tar_path, checkpoint):
+    """Arguments de reprise pour iter_tar_members_stream (seek direct si l'archive n'est pas compressée)."""
+    if checkpoint is None:
+        return {}
+    if is_plain_tar(tar_path):
+        return {'start_offset': checkpoint['tar_offset'], 'first_index': checkpoint['member_index']}
+    return {'skip_members': checkpoint['member_index']}
+
+def new_extraction_stats(checkpoint, workers=1):
+    """Statistiques initiales (le nombre de documents repart de celui du point de contrôle)."""
+    return {'doc_count': checkpoint['doc_total'] if checkpoint else 0, 'file_read_count': 0,
+            'skipped_members': 0, 'decompression_errors': 0, 'workers': workers}
+
+def extract_ap_streaming(tar_path, output_dir, n_shards=None, resume=True, compression=None, document_sink=None):
+    """Extrait les documents de l'archive vers N shards JSONL en streaming. Retourne les statistiques.
+
+    document_sink (optionnel) reçoit aussi chaque bloc JSONL écrit, par exemple un StreamingLuceneIndexer.
+    """
+    n_shards = n_shards or os.cpu_count() or 1
+    writer, manifest_file, checkpoint = open_extraction_output(output_dir, tar_path, n_shards, resume, compression)
+    stats = new_extraction_stats(checkpoint)
+    start_doc_count = stats['doc_count']
+    start_time = time.time()
+    with writer, manifest_file:
+        members = iter_tar_members_stream(tar_path, **resume_arguments(tar_path, checkpoint))
+        for member, member_file, position in tqdm(members, desc="Traitement des fichiers TAR (flux)"):
+            if member_file is None or not member.name.lower().endswith(('.gz', '.z')):
+                stats['skipped_members'] += 1
+                continue
+            stats['file_read_count'] += 1
+            writer.start_member()
+            docnos = []
+            try:
+                stream, is_compressed = open_member_stream(member_file)
+                if not is_compressed:
+                    stats['decompression_errors'] += 1
+                with stream: # Décodeur natif : gzip et son thread sont arrêtés avant le membre suivant
+                    for doc_id, doc_text in iter_docs_stream(stream):
+                        json_line = (json.dumps({"id": doc_id, "contents": doc_text}) + '\n').encode('utf-8')
+                        writer.write(json_line)
+                        if document_sink is not None:
+                            document_sink(json_line)
+                        docnos.append(doc_id)
+                        stats['doc_count'] += 1
+            except (EOFError, OSError) as e_member:
+                # gzip / .Z tronqué ou corrompu : on garde les documents déjà émis et on passe au suivant
+                print(f"\nErreur de décompression pour {member.name}: {e_member}")
+                stats['decompression_errors'] += 1
+            record_member_checkpoint(writer, manifest_file, member.name, position, stats, docnos)
+    elapsed = time.time() - start_time
+    stats['docs_per_sec'] = (stats['doc_count'] - start_doc_count) / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def iter_member_payloads(tar_path, stats, **resume_args):
+    """Lit en flux les octets compressés de chaque membre .gz/.Z (un membre à la fois)."""
+    for member, member_file, position in iter_tar_members_stream(tar_path, **resume_args):
+        if member_file is None or not member.name.lower().endswith(('.gz', '.z')):
+            stats['skipped_members'] += 1
+            continue
+        stats['file_read_count'] += 1
+        yield member.name, member_file.read(), position
+
+def parse_member_bytes(payload):
+    """(Processus fils) Décompresse un membre, parse ses <DOC> et retourne le bloc JSONL sérialisé et ses docnos."""
+    member_name, raw_bytes, position = payload
+    try:
+        content_bytes, is_compressed = decompress_member(raw_bytes)
+    except (EOFError, OSError):
+        return member_name, position, b"", [], 1
+    errors = 0 if is_compressed else 1
+    docnos, json_lines = [], []
+    for doc_id, doc_text in TrecSgmlScanner().scan(content_bytes):
+        docnos.append(doc_id)
+        json_lines.append(json.dumps({"id": doc_id, "contents": doc_text}) + '\n')
+    return member_name, position, ''.join(json_lines).encode('utf-8'), docnos, errors
+
+def iter_ordered_parallel(func, tasks, workers, max_pending=None):
+    """Applique func en parallèle en conservant l'ordre des tâches, avec un nombre borné de tâches en vol."""
+    if workers <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    max_pending = max_pending or workers * 4 # Borne la mémoire : le lecteur n'avance pas plus vite que les workers
+    pending = deque()
+    with Pool(workers) as pool:
+        for task in tasks:
+            pending.append(pool.apply_async(func, (task,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def load_member_samples(tar_path, max_members=50):
+    """Retourne le contenu décompressé des premiers membres gzip / .Z (pour benchmark_sgml_scanner)."""
+    samples = []
+    for member, member_file, _ in iter_tar_members_stream(tar_path):
+        if member_file is None or not member.name.lower().endswith(('.gz', '.z')):
+            continue
+        try:
+            content_bytes, is_compressed = decompress_member(member_file.read())
+        except (EOFError, OSError):
+            continue
+        if not is_compressed:
+            continue
+        samples.append(content_bytes)
+        if len(samples) >= max_members:
+            break
+    return samples
+
+def extract_ap_parallel(tar_path, output_dir, n_shards=None, workers=None, resume=True, compression=None,
+                        document_sink=None):
+    """Extrait l'archive avec un Pool de workers et un écrivain unique ordonné. Retourne les statistiques.
+
+    document_sink (optionnel) reçoit aussi chaque bloc JSONL écrit, par exemple un StreamingLuceneIndexer.
+    """
+    workers = workers or os.cpu_count() or 1
+    n_shards = n_shards or os.cpu_count() or 1
+    writer, manifest_file, checkpoint = open_extraction_output(output_dir, tar_path, n_shards, resume, compression)
+    stats = new_extraction_stats(checkpoint, workers)
+    start_doc_count = stats['doc_count']
+    start_time = time.time()
+    with writer, manifest_file:
+        payloads = iter_member_payloads(tar_path, stats, **resume_arguments(tar_path, checkpoint))
+        results = iter_ordered_parallel(parse_member_bytes, payloads, workers)
+        for member_name, position, jsonl_block, docnos, errors in tqdm(results, desc=f"Extraction parallèle ({workers} workers)"):
+            writer.start_member()
+            writer.write(jsonl_block)
+            if document_sink is not None:
+                document_sink(jsonl_block)
+            stats['doc_count'] += len(docnos)
+            stats['decompression_errors'] += errors
+            record_member_checkpoint(writer, manifest_file, member_name, position, stats, docnos)
+    elapsed = time.time() - start_time
+    stats['docs_per_sec'] = (stats['doc_count'] - start_doc_count) / elapsed if elapsed > 0 else 0.0
+    return stats
+
+class StreamingLuceneIndexer:
+    """Puits de documents pour extract_ap_* : pousse les lignes JSONL par lots dans un LuceneIndexer (même JVM).
+
+    L'index est construit pendant l'extraction : les workers parsent les membres suivants
+    pendant que Lucene indexe le lot courant.
+    """
+
+    def __init__(self, index_dir, threads=None, batch_size=STREAM_INDEX_BATCH_SIZE):
+        from pyserini.index.lucene import LuceneIndexer # Import tardif : démarre la JVM
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir) # Pas d'ajout à un index partiel d'une exécution précédente
+        args = ["-index", index_dir, "-threads", str(threads or os.cpu_count() or 1),
+                *index_profile_options(INDEX_PROFILE, prefix="-")] # Même profil que la cellule 1.2
+        self.indexer = LuceneIndexer(args=args)
+        self.batch_size = batch_size
+        self.batch = []
+        self.doc_count = 0
+
+    def __call__(self, jsonl_block):
+        self.batch.extend(jsonl_block.decode('utf-8').splitlines())
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.indexer.add_batch_raw(self.batch)
+            self.doc_count += len(self.batch)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.indexer.close() # Commit de l'index
+
+def trec_member_paths(members_dir):
+    """Membres .gz écrits par unpack_ap_members, triés (ordre de l'archive pour les noms AP)."""
+    return sorted(glob.glob(os.path.join(members_dir, "*.gz")))
+
+def trec_identity(tar_path):
+    """Identité du mode "trec" : archive et extracteur (pas de shards ni de compression JSONL)."""
+    return dict(fingerprint_archive(tar_path), format="trec")
+
+def is_unpack_up_to_date(tar_path, members_dir):
+    """True si members_dir contient exactement les membres issus de la même archive et du même extracteur."""
+    record = load_extraction_fingerprint(members_dir)
+    if record is None:
+        return False, record
+    paths = trec_member_paths(members_dir)
+    if [os.path.getsize(path) for path in paths] != record.get('output_sizes'):
+        return False, record
+    return same_archive(record, trec_identity(tar_path)), record
+
+def unpack_ap_members(tar_path, members_dir):
+    """Mode "trec" : écrit chaque membre de l'archive en .gz dans members_dir, sans sérialisation JSON.
+
+    Les membres gzip sont copiés tels quels ; les .Z et les membres non compressés sont recompressés en gzip
+    pour TrecCollection. Seuls les <DOC> sont comptés. Retourne les statistiques.
+    """
+    fingerprint_path = os.path.normpath(members_dir) + ".fingerprint"
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path)
+    if os.path.isdir(members_dir):
+        shutil.rmtree(members_dir) # Membres d'une archive précédente
+    os.makedirs(members_dir)
+    stats = new_extraction_stats(None)
+    start_time = time.time()
+    for member, member_file, _ in tqdm(iter_tar_members_stream(tar_path), desc="Copie des membres TREC"):
+        if member_file is None or not member.name.lower().endswith(('.gz', '.z')):
+            stats['skipped_members'] += 1
+            continue
+        stats['file_read_count'] += 1
+        raw_bytes = member_file.read()
+        try:
+            content_bytes, is_compressed = decompress_member(raw_bytes)
+        except (EOFError, OSError) as e_member:
+            print(f"\nErreur de décompression pour {member.name}: {e_member}")
+            stats['decompression_errors'] += 1
+            continue
+        if not is_compressed:
+            stats['decompression_errors'] += 1
+        stem = os.path.splitext(os.path.basename(member.name))[0]
+        with open(os.path.join(members_dir, stem + ".gz"), 'wb') as out:
+            out.write(raw_bytes if raw_bytes[:2] == b"\x1f\x8b" else gzip.compress(content_bytes, compresslevel=6))
+        stats['doc_count'] += content_bytes.count(b"<DOC>")
+    elapsed = time.time() - start_time
+    stats['docs_per_sec'] = stats['doc_count'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def write_unpack_fingerprint(tar_path, members_dir, stats):
+    """Enregistre l'empreinte de l'archive une fois les membres copiés."""
+    record = dict(trec_identity(tar_path),
+                  output_sizes=[os.path.getsize(path) for path in trec_member_paths(members_dir)],
+                  doc_count=stats['doc_count'], completed_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(os.path.normpath(members_dir) + ".fingerprint", 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    return record
+
+def directory_file_sizes(directory):
+    """{chemin relatif: taille} de tous les fichiers d'un dossier (shards prétraités, index Lucene)."""
+    sizes = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            sizes[os.path.relpath(path, directory)] = os.path.getsize(path)
+    return sizes
+
+def corpus_source_identity(source_dir):
+    """Identité du corpus source d'après son empreinte (cellule 0.4c), ou None s'il n'en a pas."""
+    record = load_extraction_fingerprint(source_dir)
+    if record is None:
+        return None
+    return {key: record.get(key) for key in ('archive_hash', 'extractor_version', 'format', 'shards', 'compression', 'doc_count')}
+
+def is_artifact_up_to_date(output_dir, identity):
+    """True si output_dir (corpus prétraité) a été produit avec identity et n'a pas changé depuis (index : manifeste)."""
+    record = load_extraction_fingerprint(output_dir)
+    if record is None or identity.get('source') is None or not os.path.isdir(output_dir):
+        return False, record
+    if record.get('identity') != json.loads(json.dumps(identity)):
+        return False, record
+    return record.get('output_sizes') == directory_file_sizes(output_dir), record
+
+def write_artifact_fingerprint(output_dir, identity, doc_count=None):
+    """Enregistre l'identité d'un artefact terminé (pas d'empreinte si la source n'en a pas)."""
+    if identity.get('source') is None:
+        return None
+    record = dict(identity=identity, output_sizes=directory_file_sizes(output_dir), doc_count=doc_count,
+                  completed_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(os.path.normpath(output_dir) + ".fingerprint", 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    return record
+
+def copy_artifact(src_dir, dst_dir):
+    """Copie un artefact terminé et son empreinte voisine (disque local <-> Drive).
+
+    Le dossier est copié à côté puis renommé, l'empreinte en dernier : une copie interrompue n'est jamais prise
+    pour un artefact complet (le manifeste d'un index, dans son dossier, n'arrive qu'avec le renommage).
+    """
+    src_fingerprint = os.path.normpath(src_dir) + ".fingerprint"
+    dst_fingerprint = os.path.normpath(dst_dir) + ".fingerprint"
+    if os.path.exists(dst_fingerprint):
+        os.remove(dst_fingerprint)
+    tmp_dir = os.path.normpath(dst_dir) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(src_dir, tmp_dir)
+    shutil.rmtree(dst_dir, ignore_errors=True)
+    os.rename(tmp_dir, dst_dir)
+    if os.path.exists(src_fingerprint):
+        shutil.copy2(src_fingerprint, dst_fingerprint)
+
+def index_profile_for(needs):
+    """Profil le moins coûteux dont les options couvrent celles de tous les profils de needs."""
+    required = {option for need in needs for option in INDEX_PROFILES[need]}
+    for profile, options in INDEX_PROFILES.items():
+        if required <= set(options):
+            return profile
+    raise ValueError(f"Aucun profil d'index ne couvre les besoins {sorted(set(needs))}")
+
+def index_profile_options(profile, prefix="--"):
+    """Options de stockage d'un profil (préfixe "-" pour les arguments de LuceneIndexer)."""
+    return [prefix + option.lstrip('-') for option in INDEX_PROFILES[profile]]
+
+def index_component_sizes(index_dir):
+    """Octets par composant Lucene (postings, positions, docvectors, stored...) d'un index."""
+    sizes = Counter()
+    for name, size in index_file_sizes(index_dir).items():
+        sizes[LUCENE_FILE_COMPONENTS.get(os.path.splitext(name)[1], 'other')] += size
+    return dict(sizes)
+
+INDEX_PROFILE = index_profile_for(SEARCH_INDEX_NEEDS.values())
+
+# --- Construction d'index par sous-index parallèles ---
+# Chaque sous-index est construit par son propre processus pyserini (sa JVM, son IndexWriter) à partir d'un groupe de
+# shards ; les sous-index sont ensuite fusionnés (IndexWriter.addIndexes, qui copie leurs segments sans les réécrire).
+# Le compactage final (forceMerge) est optionnel : il réécrit tout l'index une seconde fois. Pour l'activer, donner à
+# INDEX_MERGE_SEGMENTS le nombre de segments voulu (1 : recherche un peu plus rapide, mais chaque suppression d'une
+# mise à jour incrémentale touche alors l'unique segment).
+INDEX_PART_THREADS = 4 # Threads d'indexation par sous-index
+INDEX_MERGE_SEGMENTS = None # Segments après forceMerge (None : garder les segments des sous-index, pas de forceMerge)
+INDEX_CONCURRENT_BUILDS = (os.cpu_count() or 1) >= 16 # Index Baseline et prétraité construits en même temps (cœurs partagés)
+INDEX_STALL_TIMEOUT = 600 # Secondes sans nouvelle ligne de journal ni croissance de l'index avant d'arrêter la construction
+INDEX_POLL_SECONDS = 2 # Intervalle de lecture des journaux des sous-index
+INDEX_PARTS_DIR = os.path.join(OUTPUT_DIR, "index_parts") # Sous-index et liens vers les shards : disque local (pas de liens symboliques sur le Drive)
+INDEXER_PROGRESS_PATTERN = re.compile(r"([\d,]+) documents indexed") # Lignes de progression d'IndexCollection (Anserini)
+
+def index_input_paths(input_dir):
+    """Fichiers d'entrée d'une collection : shards JSONL, sinon membres TREC .gz."""
+    return sorted(glob.glob(os.path.join(input_dir, "*.jsonl*"))) or trec_member_paths(input_dir)
+
+def replace_command_argument(cmd, flag, value):
+    """Copie d'une commande pyserini avec la valeur de flag remplacée."""
+    cmd = list(cmd)
+    cmd[cmd.index(flag) + 1] = value
+    return cmd
+
+def merge_index_parts(part_dirs, index_dir, max_segments=None):
+    """Fusionne des index Lucene dans index_dir (recréé), puis forceMerge à max_segments segments (même JVM que pyserini)."""
+    import pyserini.index.lucene # Import tardif : classpath Anserini et démarrage de la JVM
+    from jnius import autoclass
+    FSDirectory = autoclass('org.apache.lucene.store.FSDirectory')
+    Paths = autoclass('java.nio.file.Paths')
+    IndexWriter = autoclass('org.apache.lucene.index.IndexWriter')
+    IndexWriterConfig = autoclass('org.apache.lucene.index.IndexWriterConfig')
+    OpenMode = autoclass('org.apache.lucene.index.IndexWriterConfig$OpenMode')
+    if part_dirs and os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    config = IndexWriterConfig()
+    config.setOpenMode(OpenMode.CREATE_OR_APPEND)
+    writer = IndexWriter(FSDirectory.open(Paths.get(os.path.abspath(index_dir))), config)
+    try:
+        if part_dirs:
+            part_directories = [FSDirectory.open(Paths.get(os.path.abspath(part_dir))) for part_dir in part_dirs]
+            writer.addIndexes(part_directories)
+            for directory in part_directories:
+                directory.close()
+        if max_segments:
+            writer.forceMerge(max_segments)
+        writer.commit()
+    finally:
+        writer.close()
+
+class ShardedIndexBuild:
+    """Construit un index en sous-index parallèles (un processus pyserini par groupe de shards), puis les fusionne.
+
+    start() lance les processus sans attendre ; wait() suit leurs journaux en direct (documents indexés, docs/s,
+    segments, temps restant), arrête la construction si elle ne progresse plus, fusionne et retourne ses métriques.
+    Avec un seul groupe, l'index est construit directement dans index_dir (forceMerge seulement si INDEX_MERGE_SEGMENTS).
+    """
+
+    def __init__(self, index_cmd, input_paths, cores=None, expected_docs=None, stall_timeout=None):
+        self.index_cmd = index_cmd
+        self.index_dir = index_cmd[index_cmd.index("--index") + 1]
+        index_key = hashlib.blake2b(os.path.abspath(self.index_dir).encode('utf-8'), digest_size=4).hexdigest()
+        self.parts_dir = os.path.join(INDEX_PARTS_DIR, f"{os.path.basename(os.path.normpath(self.index_dir))}.{index_key}")
+        cores = cores or os.cpu_count() or 1
+        n_parts = max(1, min(len(input_paths), cores // INDEX_PART_THREADS))
+        self.groups = [group for group in balance_paths(input_paths, n_parts) if group]
+        self.threads = max(1, min(INDEX_PART_THREADS, cores // len(self.groups)))
+        self.expected_docs = expected_docs
+        self.stall_timeout = stall_timeout or INDEX_STALL_TIMEOUT
+        self.processes = []
+
+    def part_commands(self):
+        """Commandes des sous-index : --input pointe vers un dossier de liens vers les shards du groupe."""
+        if len(self.groups) == 1:
+            return [replace_command_argument(self.index_cmd, "--threads", str(self.threads))]
+        commands = []
+        for part, group in enumerate(self.groups):
+            input_dir = os.path.join(self.parts_dir, f"input_{part:02d}")
+            os.makedirs(input_dir)
+            for path in group:
+                os.symlink(os.path.abspath(path), os.path.join(input_dir, os.path.basename(path)))
+            cmd = replace_command_argument(self.index_cmd, "--input", input_dir)
+            cmd = replace_command_argument(cmd, "--index", os.path.join(self.parts_dir, f"index_{part:02d}"))
+            commands.append(replace_command_argument(cmd, "--threads", str(self.threads)))
+        return commands
+
+    def start(self):
+        for name in (INDEX_MANIFEST_NAME, INDEX_MEMBERS_NAME): # L'index n'est plus valide avant la fin de la construction
+            if os.path.exists(os.path.join(self.index_dir, name)):
+                os.remove(os.path.join(self.index_dir, name))
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        self.start_time = time.time()
+        for part, cmd in enumerate(self.part_commands()):
+            log_path = os.path.join(self.parts_dir, f"part_{part:02d}.log")
+            log_file = open(log_path, 'w')
+            process = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, text=True)
+            # Journal relu en binaire et décodé de façon incrémentale : une lecture peut s'arrêter au milieu d'un
+            # caractère UTF-8 multi-octets, complété à la lecture suivante (octets invalides remplacés).
+            self.processes.append({'cmd': cmd, 'process': process, 'log_file': log_file, 'reader': open(log_path, 'rb'),
+                                   'decoder': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+                                   'pending': "", 'lines': [], 'docs': 0})
+        print(f"  {len(self.processes)} sous-index lancés pour {self.index_dir} ({self.threads} threads chacun).")
+        return self
+
+    def stop(self):
+        """Arrête les processus encore actifs et ferme leurs journaux."""
+        for part in self.processes:
+            if part['process'].poll() is None:
+                part['process'].kill()
+                part['process'].wait()
+            part['log_file'].close()
+            part['reader'].close()
+
+    def part_index_dirs(self):
+        return [part['cmd'][part['cmd'].index("--index") + 1] for part in self.processes]
+
+    def read_new_lines(self, part):
+        """Lignes complètes ajoutées au journal d'un sous-index depuis la dernière lecture."""
+        data = part['pending'] + part['decoder'].decode(part['reader'].read())
+        *lines, part['pending'] = data.split('\n')
+        part['lines'].extend(lines)
+        return lines
+
+    def follow(self, progress):
+        """Suit les journaux jusqu'à la fin des processus ; lève TimeoutExpired si rien ne progresse pendant stall_timeout."""
+        last_activity, last_bytes, peak_segments = time.time(), None, 0
+        while True:
+            finished = all(part['process'].poll() is not None for part in self.processes)
+            active = False
+            for number, part in enumerate(self.processes):
+                for line in self.read_new_lines(part):
+                    active = True
+                    match = INDEXER_PROGRESS_PATTERN.search(line)
+                    if match:
+                        part['docs'] = max(part['docs'], int(match.group(1).replace(',', '')))
+                    if line.strip():
+                        progress.write(f"  [{number:02d}] {line.rstrip()}")
+            file_sizes = [index_file_sizes(path) for path in self.part_index_dirs() if os.path.isdir(path)]
+            segments = sum(name.endswith('.si') for sizes in file_sizes for name in sizes)
+            index_bytes = sum(size for sizes in file_sizes for size in sizes.values())
+            peak_segments = max(peak_segments, segments)
+            active = active or index_bytes != last_bytes
+            last_bytes = index_bytes
+            docs = sum(part['docs'] for part in self.processes)
+            progress.update(docs - progress.n)
+            progress.set_postfix(segments=segments, taille=f"{index_bytes / 1e6:.0f} Mo")
+            if finished:
+                return peak_segments
+            if active:
+                last_activity = time.time()
+            elif time.time() - last_activity > self.stall_timeout:
+                raise subprocess.TimeoutExpired(self.index_cmd, self.stall_timeout, output=self.log_text())
+            time.sleep(INDEX_POLL_SECONDS)
+
+    def log_text(self):
+        return '\n'.join('\n'.join(part['lines'] + [part['pending']]) for part in self.processes)
+
+    def wait(self):
+        """Attend les sous-index, les fusionne et enregistre les métriques de la construction (<index>.metrics.json)."""
+        progress = tqdm(total=self.expected_docs, desc=f"Indexation {os.path.basename(os.path.normpath(self.index_dir))}", unit=" docs")
+        try:
+            peak_segments = self.follow(progress)
+        finally:
+            progress.close()
+            self.stop() # Watchdog : construction bloquée ou interrompue
+        for part in self.processes:
+            if part['process'].returncode != 0:
+                raise subprocess.CalledProcessError(part['process'].returncode, part['cmd'], output=self.log_text(), stderr="")
+        build_seconds = time.time() - self.start_time
+        merge_start = time.time()
+        part_dirs = [] if len(self.groups) == 1 else self.part_index_dirs()
+        if part_dirs or INDEX_MERGE_SEGMENTS:
+            merge_index_parts(part_dirs, self.index_dir, INDEX_MERGE_SEGMENTS)
+        output = self.log_text()
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        docs = sum(part['docs'] for part in self.processes)
+        index_sizes = index_file_sizes(self.index_dir)
+        metrics = {'index_dir': self.index_dir, 'parts': len(self.groups), 'threads_per_part': self.threads,
+                   'documents': docs, 'expected_documents': self.expected_docs,
+                   'build_seconds': build_seconds, 'merge_seconds': time.time() - merge_start,
+                   'docs_per_sec': docs / build_seconds if build_seconds > 0 else 0.0,
+                   'peak_segments': peak_segments, 'segments': sum(name.endswith('.si') for name in index_sizes),
+                   'index_bytes': sum(index_sizes.values()), 'component_bytes': index_component_sizes(self.index_dir),
+                   'completed_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        metrics_path = os.path.normpath(self.index_dir) + ".metrics.json"
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2)
+        print(f"  {docs} documents en {build_seconds:.1f} s ({metrics['docs_per_sec']:.0f} docs/s), fusion en "
+              f"{metrics['merge_seconds']:.1f} s, {metrics['segments']} segment(s). Métriques: {metrics_path}")
+        return dict(metrics, stdout=output, stderr="")
+
+def print_index_statistics(index_dir):
+    """Statistiques par fichier d'un index, calculées ici : taille, nombre de fichiers et de segments, composants."""
+    sizes = index_file_sizes(index_dir) if os.path.isdir(index_dir) else {}
+    if not sizes:
+        print("  ATTENTION: Le dossier de l'index n'a pas été créé ou est vide.")
+        return None
+    segments = sum(name.endswith('.si') for name in sizes)
+    print(f"  Taille de l'index: {sum(sizes.values()) / 1e6:.1f} Mo, {len(sizes)} fichiers, {segments} segment(s).")
+    for component, size in sorted(index_component_sizes(index_dir).items(), key=lambda item: -item[1]):
+        print(f"    {component:11s} {size / 1e6:10.1f} Mo")
+    largest = max(sizes, key=sizes.get)
+    print(f"  Plus gros fichier: {largest} ({sizes[largest] / 1e6:.1f} Mo).")
+    return sizes
+
+# --- Manifeste d'index ---
+# Chaque index porte dans son dossier un manifeste (index_manifest.json) : empreinte du corpus source, analyseur,
+# profil et options de stockage, versions de Pyserini et de Lucene, et taille de chaque fichier de l'index.
+# Il voyage avec l'index (copie depuis/vers Drive) : un index n'est réutilisé que si son manifeste correspond
+# exactement à la configuration courante ; sinon il est reconstruit ("rebuild") ou la cellule s'arrête ("refuse").
+INDEX_MANIFEST_NAME = "index_manifest.json"
+INDEX_MEMBERS_NAME = "index_members.bin" # Table membre -> hachage et docnos (mises à jour incrémentales, ci-dessous)
+INDEX_MANIFEST_POLICY = "rebuild" # "rebuild" ou "refuse" quand un index existant ne correspond pas à son manifeste
+
+@lru_cache(maxsize=None)
+def index_engine_versions():
+    """Versions de Pyserini et de Lucene utilisées pour écrire les index."""
+    from importlib.metadata import version
+    import pyserini.index.lucene # Import tardif : classpath Anserini et démarrage de la JVM
+    from jnius import autoclass
+    return {'pyserini': version('pyserini'), 'lucene': autoclass('org.apache.lucene.util.Version').LATEST.toString()}
+
+def index_file_sizes(index_dir):
+    """Tailles des fichiers Lucene d'un index (sans le manifeste ni la table des membres)."""
+    sizes = directory_file_sizes(index_dir)
+    for name in (INDEX_MANIFEST_NAME, INDEX_MEMBERS_NAME):
+        sizes.pop(name, None)
+    return sizes
+
+def load_index_manifest(index_dir):
+    """Manifeste enregistré dans le dossier de l'index (ou None)."""
+    manifest_path = os.path.join(index_dir, INDEX_MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+def write_index_manifest(index_dir, identity, doc_count=None):
+    """Écrit le manifeste d'un index terminé (après la table des membres, exclue des tailles)."""
+    record = dict(identity=identity, index_files=index_file_sizes(index_dir), doc_count=doc_count,
+                  completed_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(os.path.join(index_dir, INDEX_MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    return record
+
+def index_manifest_differences(index_dir, identity):
+    """Éléments du manifeste qui diffèrent de identity (liste vide : index réutilisable), ou None sans index."""
+    if not os.path.isdir(index_dir) or not index_file_sizes(index_dir):
+        return None
+    record = load_index_manifest(index_dir)
+    if record is None:
+        return ['manifeste absent']
+    recorded, expected = record.get('identity') or {}, json.loads(json.dumps(identity))
+    differences = sorted(key for key in recorded.keys() | expected.keys() if recorded.get(key) != expected.get(key))
+    if expected.get('source') is None:
+        differences.append('source sans empreinte')
+    if record.get('index_files') != index_file_sizes(index_dir):
+        differences.append('fichiers modifiés depuis le manifeste')
+    return differences
+
+def index_manifest_allows_reuse(index_dir, identity):
+    """True si l'index existant correspond à son manifeste ; sinon dit pourquoi, et s'arrête si INDEX_MANIFEST_POLICY = "refuse"."""
+    differences = index_manifest_differences(index_dir, identity)
+    if differences is None:
+        return False
+    if not differences:
+        return True
+    print(f"  Index existant dans {index_dir} non réutilisable tel quel: {', '.join(differences)}.")
+    if INDEX_MANIFEST_POLICY == "refuse":
+        raise ValueError(f"L'index {index_dir} ne correspond pas à la configuration courante ({', '.join(differences)}). "
+                         f"Supprimez-le ou passez INDEX_MANIFEST_POLICY à \"rebuild\".")
+    return False
+
+# --- Mises à jour incrémentales d'un index (par membre de l'archive) ---
+# Chaque index construit à partir des shards JSONL garde dans son dossier une table membre -> hachage du JSONL du
+# membre et docnos (index_members.bin, format StemTable), copiée du manifeste de l'extraction (load_member_manifest).
+# Si seule la source a changé depuis la construction, les membres modifiés ou disparus sont repérés en comparant
+# cette table au manifeste de la nouvelle extraction, sans relire le corpus : leurs anciens documents sont supprimés
+# (IndexWriter.deleteDocuments sur le champ "id") et les documents des membres modifiés sont relus dans leur seule
+# plage d'octets du shard, puis ajoutés par LuceneIndexer en mode append. forceMergeDeletes garde le seuil par défaut
+# de Lucene (10 %) : seuls les segments très touchés sont réécrits, les autres gardent quelques documents supprimés,
+# qui comptent encore dans les statistiques de collection (df) jusqu'à leur prochaine fusion ; au-delà de
+# INDEX_UPDATE_MAX_FRACTION, l'index est reconstruit.
+INDEX_INCREMENTAL_UPDATES = True
+INDEX_UPDATE_MAX_FRACTION = 0.05 # Part maximale de documents à supprimer/ajouter pour une mise à jour incrémentale
+
+def index_members_path(index_dir):
+    """Table membre -> hachage et docnos des documents indexés, dans le dossier de l'index."""
+    return os.path.join(index_dir, INDEX_MEMBERS_NAME)
+
+def write_index_members(index_dir, members):
+    """Remplace la table des membres de l'index (après une construction complète ou une mise à jour)."""
+    table_path = index_members_path(index_dir)
+    if os.path.exists(table_path):
+        os.remove(table_path)
+    table = StemTable(table_path)
+    for entry in members:
+        table.add(entry['member'], ' '.join([entry['digest'], *entry['docnos']]))
+    table.save()
+    table.close()
+
+def plan_index_update(index_dir, identity, members):
+    """Documents à supprimer et membres à (ré)indexer, ou None si l'index n'a pas été construit avec les mêmes options."""
+    if not os.path.exists(index_members_path(index_dir)) or index_manifest_differences(index_dir, identity) != ['source']:
+        return None # Seule la source doit différer du manifeste (mêmes options, versions, fichiers intacts)
+    table = StemTable(index_members_path(index_dir))
+    indexed = {member: value.split(' ') for member, value in table.items()}
+    table.close()
+    changed = [entry for entry in members if indexed.get(entry['member'], [None])[0] != entry['digest']]
+    unchanged = {entry['member'] for entry in members} - {entry['member'] for entry in changed}
+    stale = indexed.keys() - unchanged
+    old_docnos = {docno for member in stale for docno in indexed[member][1:]}
+    new_docnos = {docno for entry in changed for docno in entry['docnos']}
+    kept_docnos = {docno for member, value in indexed.items() if member not in stale for docno in value[1:]}
+    if (old_docnos | new_docnos) & kept_docnos:
+        return None # Un docno partagé avec un membre inchangé : la suppression par id le toucherait aussi
+    return {'delete': sorted(old_docnos), 'add': changed, 'added': len(new_docnos - old_docnos),
+            'replaced': len(new_docnos & old_docnos), 'deleted': len(old_docnos - new_docnos)}
+
+def apply_index_update(index_dir, plan, indexer_args, transform=None, threads=None):
+    """Supprime les documents des membres périmés (par docno), puis ajoute ceux des membres modifiés.
+
+    transform (optionnel) convertit chaque ligne JSONL source en ligne de la collection indexée (index prétraité).
+    """
+    from pyserini.index.lucene import LuceneIndexer # Import tardif : démarre la JVM
+    from jnius import autoclass
+    FSDirectory = autoclass('org.apache.lucene.store.FSDirectory')
+    Paths = autoclass('java.nio.file.Paths')
+    IndexWriter = autoclass('org.apache.lucene.index.IndexWriter')
+    IndexWriterConfig = autoclass('org.apache.lucene.index.IndexWriterConfig')
+    OpenMode = autoclass('org.apache.lucene.index.IndexWriterConfig$OpenMode')
+    Term = autoclass('org.apache.lucene.index.Term')
+    if plan['delete']:
+        config = IndexWriterConfig()
+        config.setOpenMode(OpenMode.APPEND)
+        writer = IndexWriter(FSDirectory.open(Paths.get(os.path.abspath(index_dir))), config)
+        try:
+            for i in range(0, len(plan['delete']), STREAM_INDEX_BATCH_SIZE):
+                writer.deleteDocuments([Term("id", docno) for docno in plan['delete'][i:i + STREAM_INDEX_BATCH_SIZE]])
+            writer.forceMergeDeletes() # Seuil par défaut : seuls les segments à plus de 10 % de suppressions sont réécrits
+            writer.commit()
+        finally:
+            writer.close()
+    if plan['add']:
+        args = ["-index", index_dir, "-threads", str(threads or os.cpu_count() or 1), *indexer_args]
+        indexer = LuceneIndexer(args=args, append=True)
+        for entry in plan['add']:
+            lines = read_member_lines(entry) # Seulement la plage d'octets du membre dans son shard
+            for i in range(0, len(lines), STREAM_INDEX_BATCH_SIZE):
+                batch = lines[i:i + STREAM_INDEX_BATCH_SIZE]
+                indexer.add_batch_raw(list(map(transform, batch)) if transform else batch)
+        indexer.close()
+
+def update_index_incrementally(index_cmd, identity, source_dir, transform=None):
+    """Met l'index de index_cmd à jour membre par membre si possible, d'après le manifeste de l'extraction source_dir.
+
+    Retourne (plan appliqué ou None si une reconstruction complète est nécessaire, membres de la source ou None).
+    """
+    if not INDEX_INCREMENTAL_UPDATES or index_cmd[index_cmd.index("--collection") + 1] != "JsonCollection":
+        return None, None # LuceneIndexer n'ajoute que des documents JsonCollection
+    members = load_member_manifest(source_dir) if source_dir else None
+    if members is None:
+        return None, None # Corpus sans manifeste par membre (mode "trec", extracteur antérieur)
+    index_dir = index_cmd[index_cmd.index("--index") + 1]
+    doc_count = sum(len(entry['docnos']) for entry in members)
+    plan = plan_index_update(index_dir, identity, members)
+    if plan is None or plan['added'] + plan['replaced'] + plan['deleted'] > INDEX_UPDATE_MAX_FRACTION * doc_count:
+        return None, members
+    # Options de stockage et d'analyse de la commande pyserini, au format de LuceneIndexer ("-option")
+    indexer_args = [arg[1:] if arg.startswith("--") else arg for arg in index_cmd[index_cmd.index("--threads") + 2:]]
+    apply_index_update(index_dir, plan, indexer_args, transform)
+    write_index_members(index_dir, members)
+    write_index_manifest(index_dir, identity, doc_count)
+    return plan, members
+
+def balance_paths(paths, n_groups):
+    """Répartit des fichiers en n_groups groupes de tailles proches (l'ordre est conservé dans chaque groupe)."""
+    groups, sizes = [[] for _ in range(n_groups)], [0] * n_groups
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        smallest = sizes.index(min(sizes))
+        groups[smallest].append(path)
+        sizes[smallest] += os.path.getsize(path)
+    return [sorted(group) for group in groups if group]
+
+def iter_jsonl_documents(paths, stats):
+    """(id, contents) de shards JSONL ; les lignes illisibles ou sans id sont comptées dans stats['errors']."""
+    for path in paths:
+        with open_corpus_reader(path) as infile:
+            for line in infile:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    stats['errors'] += 1
+                    continue
+                doc_id = data.get('id', None)
+                if doc_id is None:
+                    stats['errors'] += 1
+                    continue
+                yield str(doc_id), data.get('contents', '')
+
+def iter_trec_documents(paths, stats):
+    """(docno, texte) de membres TREC compressés, parsés en flux par TrecSgmlScanner."""
+    for path in paths:
+        with open(path, 'rb') as member_file:
+            try:
+                stream, _ = open_member_stream(member_file)
+                with stream:
+                    yield from iter_docs_stream(stream)
+            except (EOFError, OSError) as e_member:
+                print(f"\nErreur de décompression pour {path}: {e_member}")
+                stats['errors'] += 1
+
+print("Fonctions d'extraction en streaming et parallèle définies.")
+
+# === Cellule 0.4c: Lancer l'Extraction Optimisée ===
+import os
+import time
+import traceback
+
+# --- Paramètres ---
+EXTRACTION_MODE = "parallel" # "parallel" (Pool + écrivain ordonné) ou "streaming" (un seul cœur, mémoire minimale)
+EXTRACT_WORKERS = os.cpu_count() # Nombre de processus de décompression/parsing (--workers)
+RUN_SGML_BENCHMARK = False # True pour comparer le scanner SGML et les regex sur les premiers membres
+RESUME_EXTRACTION = True # Reprendre au premier membre non terminé si un manifeste de reprise existe
+FORCE_EXTRACTION = False # True pour ré-extraire même si l'empreinte de AP.tar n'a pas changé
+CORPUS_SHARDS = os.cpu_count() # Nombre de shards JSONL (un fichier par thread d'indexation)
+CORPUS_COMPRESSION = None # None (.jsonl), "gzip" (.jsonl.gz, lu nativement par Anserini) ou "zstd" (.jsonl.zst)
+CORPUS_FORMAT = "jsonl" # "jsonl" (shards JSON) ou "trec" (membres .gz indexés par TrecCollection, sans JSONL)
+STREAM_INDEX_BASELINE = False # True (mode "jsonl") : index baseline construit pendant l'extraction (LuceneIndexer, même JVM)
+BASELINE_STREAM_INDEXED = False # Passe à True si l'index baseline a été construit ici ; la cellule 1.2 est alors sautée
+
+# Chemins définis dans la cellule de configuration complète
+JSONL_OUTPUT_DIR = os.path.join(CORPUS_DIR, "ap_docs") # Dossier passé à --input pour l'index baseline
+JSONL_OUTPUT_PATHS = shard_paths(JSONL_OUTPUT_DIR, CORPUS_SHARDS, CORPUS_COMPRESSION)
+TREC_MEMBERS_DIR = os.path.join(CORPUS_DIR, "ap_trec") # Mode "trec" : dossier passé à --input (TrecCollection)
+
+if RUN_SGML_BENCHMARK:
+    print("Benchmark scanner SGML vs regex (cellule 0.4)...")
+    benchmark_sgml_scanner(load_member_samples(AP_TAR_PATH, max_members=50))
+
+if not os.path.exists(AP_TAR_PATH):
+    raise FileNotFoundError(f"Le fichier d'archive {AP_TAR_PATH} n'a pas été trouvé.")
+
+# Vérification d'empreinte : rend inutile la restauration de ap_docs.jsonl depuis Drive
+if CORPUS_FORMAT == "trec":
+    extraction_up_to_date, extraction_record = is_unpack_up_to_date(AP_TAR_PATH, TREC_MEMBERS_DIR)
+else:
+    extraction_up_to_date, extraction_record = is_extraction_up_to_date(AP_TAR_PATH, JSONL_OUTPUT_DIR, CORPUS_SHARDS,
+                                                                          CORPUS_COMPRESSION)
+
+if extraction_up_to_date and not FORCE_EXTRACTION:
+    if CORPUS_FORMAT == "trec":
+        print(f"Membres TREC à jour : {TREC_MEMBERS_DIR} ({len(extraction_record['output_sizes'])} fichiers .gz, ", end="")
+    else:
+        print(f"Extraction à jour : {JSONL_OUTPUT_DIR} ({CORPUS_SHARDS} shards {CORPUS_SUFFIXES[CORPUS_COMPRESSION]}, ", end="")
+    print(f"{extraction_record['doc_count']} documents, "
+          f"extracteur {extraction_record['extractor_version']}, terminé le {extraction_record['completed_at']}).")
+    print("  AP.tar n'a pas changé depuis, étape sautée (FORCE_EXTRACTION = True pour forcer).")
+elif CORPUS_FORMAT == "trec":
+    print(f"Copie des membres de {AP_TAR_PATH} vers {TREC_MEMBERS_DIR} (mode trec, sans JSONL)...")
+    start_time = time.time()
+    try:
+        extraction_stats = unpack_ap_members(AP_TAR_PATH, TREC_MEMBERS_DIR)
+    except tarfile.ReadError as e_tar:
+        print(f"\nERREUR: Impossible de lire le fichier TAR {AP_TAR_PATH}. Erreur: {e_tar}")
+        raise e_tar
+    elapsed = time.time() - start_time
+    extraction_record = write_unpack_fingerprint(AP_TAR_PATH, TREC_MEMBERS_DIR, extraction_stats)
+
+    print(f"\n--- Fin de la Copie ---")
+    print(f"  {extraction_stats['file_read_count']} fichiers (.gz/.Z) copiés, {extraction_stats['skipped_members']} membres ignorés.")
+    if extraction_stats['decompression_errors'] > 0:
+        print(f"  {extraction_stats['decompression_errors']} erreurs ou avertissements de décompression rencontrés.")
+    print(f"  {extraction_stats['doc_count']} balises <DOC> dans {TREC_MEMBERS_DIR} ({elapsed:.1f} secondes).")
+    print(f"  Empreinte enregistrée dans {TREC_MEMBERS_DIR}.fingerprint")
+else:
+    print(f"Extraction ({EXTRACTION_MODE}) depuis {AP_TAR_PATH} vers {JSONL_OUTPUT_DIR} ({CORPUS_SHARDS} shards {CORPUS_SUFFIXES[CORPUS_COMPRESSION]})...")
+    resume = RESUME_EXTRACTION and not FORCE_EXTRACTION # Forcer = repartir de zéro
+    document_sink = None
+    if STREAM_INDEX_BASELINE:
+        # L'index ne peut pas reprendre à mi-chemin : extraction et index repartent ensemble de zéro
+        resume = False
+        print(f"  Indexation baseline en flux vers {INDEX_DIR_BASELINE} ({CORPUS_SHARDS} threads Lucene).")
+        document_sink = StreamingLuceneIndexer(INDEX_DIR_BASELINE, threads=CORPUS_SHARDS)
+    start_time = time.time()
+    try:
+        if EXTRACTION_MODE == "parallel":
+            extraction_stats = extract_ap_parallel(AP_TAR_PATH, JSONL_OUTPUT_DIR, n_shards=CORPUS_SHARDS,
+                                                   workers=EXTRACT_WORKERS, resume=resume, compression=CORPUS_COMPRESSION,
+                                                   document_sink=document_sink)
+        else:
+            extraction_stats = extract_ap_streaming(AP_TAR_PATH, JSONL_OUTPUT_DIR, n_shards=CORPUS_SHARDS, resume=resume,
+                                                    compression=CORPUS_COMPRESSION, document_sink=document_sink)
+        if document_sink is not None:
+            document_sink.close()
+            BASELINE_STREAM_INDEXED = True
+    except tarfile.ReadError as e_tar:
+        print(f"\nERREUR: Impossible de lire le fichier TAR {AP_TAR_PATH}. Erreur: {e_tar}")
+        raise e_tar
+    except Exception as e_general:
+        print(f"\nERREUR générale lors de l'extraction: {e_general}")
+        traceback.print_exc()
+        raise e_general
+    elapsed = time.time() - start_time
+    extraction_record = write_extraction_fingerprint(AP_TAR_PATH, JSONL_OUTPUT_DIR, CORPUS_SHARDS, extraction_stats,
+                                                     CORPUS_COMPRESSION)
+
+    print(f"\n--- Fin de l'Extraction ---")
+    print(f"  {extraction_stats['file_read_count']} fichiers (.gz/.Z) lus depuis l'archive (hors membres déjà extraits).")
+    print(f"  {extraction_stats['skipped_members']} membres ignorés.")
+    if extraction_stats['decompression_errors'] > 0:
+        print(f"  {extraction_stats['decompression_errors']} erreurs ou avertissements de décompression rencontrés.")
+    print(f"  {extraction_stats['doc_count']} documents écrits dans {JSONL_OUTPUT_DIR} en {elapsed:.1f} secondes.")
+    print(f"  Débit: {extraction_stats['docs_per_sec']:.0f} docs/s ({extraction_stats['workers']} worker(s)).")
+    shard_sizes = extraction_record['output_sizes']
+    print(f"  Shards: {len(shard_sizes)} fichiers, de {min(shard_sizes)} à {max(shard_sizes)} octets.")
+    print(f"  Empreinte enregistrée dans {JSONL_OUTPUT_DIR}.fingerprint")
+    if BASELINE_STREAM_INDEXED:
+        print(f"  Index baseline construit en flux : {document_sink.doc_count} documents indexés dans {INDEX_DIR_BASELINE} "
+              f"(cellule 1.2 sautée).")
+
+if extraction_record['doc_count'] < 100000:
+    print("\n  ATTENTION: Le nombre de documents extraits semble faible.")
+
 # === Cellule 1.2: Indexation Baseline ===
 import os # Assurer que os est importé
+import glob
 import subprocess # Pour exécuter la commande pyserini
+import time
 import traceback # Pour afficher les erreurs détaillées
 
 # Chemins définis précédemment dans la cellule de configuration complète
-# JSONL_OUTPUT_PATH = os.path.join(CORPUS_DIR, "ap_docs.jsonl") # Fichier source (maintenant non vide)
+# JSONL_OUTPUT_DIR = os.path.join(CORPUS_DIR, "ap_docs") # Shards écrits par la cellule 0.4c
 # INDEX_DIR_BASELINE = os.path.join(OUTPUT_DIR, "indexes/baseline") # Dossier cible
-# CORPUS_DIR contient le fichier JSONL
 
 # S'assurer que les variables sont définies (au cas où)
 try:
@@ -5259,149 +7269,485 @@ except NameError:
     # INDEX_DIR_BASELINE = os.path.join(OUTPUT_DIR, "indexes/baseline")
     raise
 
+JSONL_OUTPUT_DIR = os.path.join(CORPUS_DIR, "ap_docs") # Shards ap_docs.00.jsonl[.gz|.zst] ... écrits par la cellule 0.4c
+TREC_MEMBERS_DIR = os.path.join(CORPUS_DIR, "ap_trec") # Membres .gz bruts (CORPUS_FORMAT = "trec")
+CORPUS_FORMAT = globals().get('CORPUS_FORMAT', "jsonl")
+
 print(f"Début de l'indexation Baseline (sans prétraitement explicite)...")
-# Pyserini utilise le dossier CORPUS_DIR comme entrée pour JsonCollection
-print(f"Dossier source contenant ap_docs.jsonl: {CORPUS_DIR}")
+if CORPUS_FORMAT == "trec":
+    # TrecCollection lit directement le SGML compressé : aucune passe JSON
+    print(f"Dossier source contenant les membres TREC .gz: {TREC_MEMBERS_DIR}")
+    index_source_paths = trec_member_paths(TREC_MEMBERS_DIR)
+    INDEX_COLLECTION_BASELINE = "TrecCollection"
+    INDEX_INPUT_BASELINE = TREC_MEMBERS_DIR
+else:
+    # Pyserini utilise le dossier des shards comme entrée pour JsonCollection
+    print(f"Dossier source contenant les shards ap_docs.NN.jsonl: {JSONL_OUTPUT_DIR}")
+    index_source_paths = sorted(glob.glob(os.path.join(JSONL_OUTPUT_DIR, "*.jsonl*")))
+    INDEX_COLLECTION_BASELINE = "JsonCollection"
 print(f"Répertoire de l'index cible: {INDEX_DIR_BASELINE}")
 
-# Vérifier si le fichier source existe et n'est pas vide
-jsonl_source_path = os.path.join(CORPUS_DIR, "ap_docs.jsonl")
-if not os.path.exists(jsonl_source_path) or os.path.getsize(jsonl_source_path) == 0:
-     raise FileNotFoundError(f"Le fichier source {jsonl_source_path} est manquant ou vide. L'étape d'extraction ('extract_code_tar_gzip_fixed') a peut-être échoué ou n'a pas été exécutée.")
+# Vérifier que les fichiers source existent et ne sont pas vides
+if not index_source_paths or sum(os.path.getsize(p) for p in index_source_paths) == 0:
+     raise FileNotFoundError(f"Les fichiers source ({CORPUS_FORMAT}) sont manquants ou vides. L'étape d'extraction (cellule 0.4c) a peut-être échoué ou n'a pas été exécutée.")
+# Les collections Anserini parallélisent par fichier : un thread par shard, au plus un par cœur pour les membres TREC
+INDEX_THREADS = len(index_source_paths) if CORPUS_FORMAT != "trec" else min(len(index_source_paths), os.cpu_count() or 1)
+print(f"  {len(index_source_paths)} fichiers trouvés, indexation avec {INDEX_THREADS} threads.")
+if CORPUS_FORMAT != "trec":
+    INDEX_INPUT_BASELINE = stage_corpus_for_indexing(JSONL_OUTPUT_DIR) # Décompresse seulement les shards .zst
+print(f"  Profil d'index: {INDEX_PROFILE} {INDEX_PROFILES[INDEX_PROFILE]} (besoins: {sorted(set(SEARCH_INDEX_NEEDS.values()))})")
 
 # Commande Pyserini pour l'indexation
 # Utilise la dernière version de Pyserini installée
 index_cmd_baseline = [
     "python", "-m", "pyserini.index.lucene",
-    "--collection", "JsonCollection",
-    "--input", CORPUS_DIR,
+    "--collection", INDEX_COLLECTION_BASELINE,
+    "--input", INDEX_INPUT_BASELINE,
     "--index", INDEX_DIR_BASELINE,
     "--generator", "DefaultLuceneDocumentGenerator",
-    "--threads", "4", # Peut être ajusté (ex: 2 ou 8 selon les ressources Colab)
-    "--storePositions", "--storeDocvectors", "--storeRaw" # Options utiles pour certaines techniques avancées
-]
+    "--threads", str(INDEX_THREADS), # Un thread par shard (CORPUS_SHARDS dans la cellule 0.4c)
+] + index_profile_options(INDEX_PROFILE) # Options de stockage requises par les cellules de recherche (SEARCH_INDEX_NEEDS)
 
-# Exécuter la commande
-print(f"Exécution de la commande: {' '.join(index_cmd_baseline)}")
-try:
-    # Utiliser subprocess.run pour une meilleure gestion des erreurs/sorties
-    # Augmentation possible du timeout si l'indexation est très longue
-    result = subprocess.run(index_cmd_baseline, check=True, capture_output=True, text=True, timeout=1800) # Timeout 30 minutes
-    print("Sortie STDOUT:\n", result.stdout)
-    print("Sortie STDERR:\n", result.stderr)
-    # Vérifier si la sortie indique un nombre non nul de documents indexés
-    if "Total 0 documents indexed" in result.stdout:
-         print("\nATTENTION: Pyserini indique que 0 document a été indexé malgré un fichier source non vide. Problème potentiel.")
-    else:
-         print(f"\nIndexation Baseline terminée. Index créé dans {INDEX_DIR_BASELINE}")
-except subprocess.CalledProcessError as e:
-    print(f"\nERREUR: L'indexation Baseline a échoué avec le code {e.returncode}")
-    print("Sortie STDOUT:\n", e.stdout)
-    print("Sortie STDERR:\n", e.stderr)
-    raise e # Arrêter si l'indexation échoue
-except subprocess.TimeoutExpired as e:
-    print(f"\nERREUR: L'indexation Baseline a dépassé le délai d'attente.")
-    print("Sortie STDOUT (partielle):\n", e.stdout)
-    print("Sortie STDERR (partielle):\n", e.stderr)
-    raise e
-except Exception as e:
-    print(f"\nERREUR inattendue pendant l'indexation Baseline: {e}")
-    traceback.print_exc()
-    raise e
+# Manifeste de l'index Baseline (cellule 0.4b) : réutilisé tel quel, mis à jour document par document ou reconstruit
+index_baseline_identity = {'collection': INDEX_COLLECTION_BASELINE, 'analyzer': "pyserini-default",
+                           'profile': INDEX_PROFILE, 'options': index_profile_options(INDEX_PROFILE),
+                           'versions': index_engine_versions(),
+                           'source': corpus_source_identity(TREC_MEMBERS_DIR if CORPUS_FORMAT == "trec" else JSONL_OUTPUT_DIR)}
 
-# Vérification finale de l'index (taille)
-print(f"\nVérification de la taille de l'index créé dans {INDEX_DIR_BASELINE}...")
-if os.path.exists(INDEX_DIR_BASELINE):
-    # Commande pour obtenir la taille totale du dossier
-    du_cmd = f"du -sh '{INDEX_DIR_BASELINE}'"
+def finish_baseline_build(build, members=None):
+    """Attend les sous-index de l'index Baseline, les fusionne et vérifie l'index obtenu."""
     try:
-        result_du = subprocess.run(du_cmd, shell=True, check=True, capture_output=True, text=True)
-        print(f"  Taille de l'index: {result_du.stdout.split()[0]}")
-    except Exception as e_du:
-        print(f"  Impossible de vérifier la taille de l'index: {e_du}")
+        result = build.wait() # Journaux de pyserini affichés en direct, métriques dans <index>.metrics.json
+        print(f"Index Baseline: {result['parts']} sous-index construits en {result['build_seconds']:.1f} s, "
+              f"fusion en {result['merge_seconds']:.1f} s.")
+        # Vérifier si la sortie indique un nombre non nul de documents indexés
+        if "Total 0 documents indexed" in result['stdout']:
+             print("\nATTENTION: Pyserini indique que 0 document a été indexé malgré un fichier source non vide. Problème potentiel.")
+        else:
+             print(f"\nIndexation Baseline terminée. Index créé dans {INDEX_DIR_BASELINE}")
+             if members is not None:
+                 write_index_members(INDEX_DIR_BASELINE, members) # Base des prochaines mises à jour incrémentales
+             write_index_manifest(INDEX_DIR_BASELINE, index_baseline_identity,
+                                  sum(len(entry['docnos']) for entry in members) if members else None)
+    except subprocess.CalledProcessError as e:
+        print(f"\nERREUR: L'indexation Baseline a échoué avec le code {e.returncode}")
+        print("Sortie STDOUT:\n", e.stdout)
+        print("Sortie STDERR:\n", e.stderr)
+        raise e # Arrêter si l'indexation échoue
+    except subprocess.TimeoutExpired as e:
+        print(f"\nERREUR: L'indexation Baseline n'a plus progressé pendant {e.timeout} secondes, processus arrêtés.")
+        print("Sortie STDOUT (partielle):\n", e.stdout)
+        raise e
+    except Exception as e:
+        print(f"\nERREUR inattendue pendant l'indexation Baseline: {e}")
+        traceback.print_exc()
+        raise e
+
+    # Vérification finale de l'index (statistiques par fichier)
+    print(f"\nVérification de l'index créé dans {INDEX_DIR_BASELINE}...")
+    print_index_statistics(INDEX_DIR_BASELINE)
+
+def join_pending_baseline_build():
+    """Termine l'index Baseline lancé en arrière-plan par cette cellule (appelé par la cellule 1.4)."""
+    global pending_baseline_build
+    if globals().get('pending_baseline_build') is not None:
+        print(f"\nAttente de l'index Baseline construit en arrière-plan...")
+        build, pending_baseline_build = pending_baseline_build, None
+        finish_baseline_build(build, baseline_members)
+
+# Exécuter la commande (sauf si la cellule 0.4c a déjà construit l'index en flux)
+pending_baseline_build = None
+baseline_update, baseline_members = None, None
+# Manifeste par membre de l'extraction (cellule 0.4c) : base des mises à jour incrémentales des deux index
+INDEX_MEMBER_SOURCE = JSONL_OUTPUT_DIR if CORPUS_FORMAT != "trec" else None
+if globals().get('BASELINE_STREAM_INDEXED', False):
+    print(f"Index Baseline déjà construit en flux par la cellule 0.4c dans {INDEX_DIR_BASELINE}, commande sautée.")
+    # Table des membres et manifeste, comme après une construction (la source a son empreinte depuis la fin de 0.4c)
+    baseline_members = load_member_manifest(JSONL_OUTPUT_DIR)
+    if baseline_members is not None:
+        write_index_members(INDEX_DIR_BASELINE, baseline_members)
+    write_index_manifest(INDEX_DIR_BASELINE, index_baseline_identity, (index_baseline_identity['source'] or {}).get('doc_count'))
+    BASELINE_STREAM_INDEXED = False # Les exécutions suivantes passent par le manifeste
+elif index_manifest_allows_reuse(INDEX_DIR_BASELINE, index_baseline_identity):
+    print(f"Index Baseline déjà à jour dans {INDEX_DIR_BASELINE} (manifeste identique), indexation sautée.")
 else:
-    print("  ATTENTION: Le dossier de l'index n'a pas été créé.")
+    # Si seule la source a changé, mise à jour des membres modifiés au lieu d'une reconstruction complète (cellule 0.4b)
+    try:
+        update_start_time = time.time()
+        baseline_update, baseline_members = update_index_incrementally(
+            index_cmd_baseline, index_baseline_identity, INDEX_MEMBER_SOURCE)
+    except Exception as e:
+        print(f"\nERREUR pendant la mise à jour incrémentale de l'index Baseline: {e}")
+        traceback.print_exc()
+        raise
+    if baseline_update is not None:
+        print(f"Index Baseline mis à jour par membre en {time.time() - update_start_time:.1f} s: {baseline_update['added']} ajoutés, "
+              f"{baseline_update['replaced']} remplacés, {baseline_update['deleted']} supprimés.")
+    else:
+        # Sous-index parallèles (un processus pyserini par groupe de shards), fusionnés puis compactés (cellule 0.4b)
+        print(f"Exécution de la commande (par sous-index): {' '.join(index_cmd_baseline)}")
+        baseline_build = ShardedIndexBuild(index_cmd_baseline, index_input_paths(INDEX_INPUT_BASELINE),
+                                           cores=(os.cpu_count() or 1) // 2 if INDEX_CONCURRENT_BUILDS else None,
+                                           expected_docs=(index_baseline_identity['source'] or {}).get('doc_count')).start()
+        if INDEX_CONCURRENT_BUILDS:
+            # Les cœurs restants servent au prétraitement (1.3) puis à l'index prétraité (1.4), qui attend celui-ci
+            pending_baseline_build = baseline_build
+            print(f"  Index Baseline en construction en arrière-plan (moitié des cœurs) ; la cellule 1.4 attendra sa fin.")
+        else:
+            finish_baseline_build(baseline_build, baseline_members)
 
 # === Cellule 1.3: Préparer les Données Prétraitées ===
 import json
+import glob
+import time
+import hashlib
+import re
+import shutil
+from array import array
+from contextlib import ExitStack
+from itertools import islice
 from tqdm.notebook import tqdm
 import os
 import traceback # Pour afficher les erreurs détaillées
 
+# --- Paramètres ---
+PREPROC_WORKERS = os.cpu_count() # Processus de prétraitement (1 = séquentiel, sans Pool)
+PREPROC_CHUNK_DOCS = 500 # Documents envoyés à un worker par tâche
+# "per_token" : preprocess_text par document (stopwords + lemmatiseur via le cache de normalize_token).
+# "vocabulary" : 1) une passe tokenise le corpus et l'encode en identifiants entiers (vocabulaire global),
+# 2) chaque forme distincte est analysée une seule fois, puis les documents sont réécrits par indexation
+# dans la table identifiant -> lemme. Même sortie, le filtrage et la lemmatisation ne sont plus par token.
+PREPROC_STRATEGY = "per_token"
+# Sortie : {"id", "contents": termes joints par des espaces} (JsonCollection, indexé avec --pretokenized).
+# Les termes restent dans l'ordre du texte : les positions, donc les requêtes de phrase et de proximité, sont conservées.
+# Prétraitement incrémental (stratégie "per_token", analyseur "python") : la sortie de chaque document est gardée
+# dans un cache indexé par le hachage de son texte, dans le dossier local de l'analyseur (DOC_CACHE_DIR, copié vers le
+# Drive comme le corpus et l'index, et restauré depuis le Drive en début de session). Au lancement suivant,
+# le cache le plus récent d'un analyseur compatible (même racinisation, filtre et tokeniseur ; seuls les stopwords
+# peuvent différer) fournit la sortie des documents dont le texte est inchangé et ne contient aucun des mots
+# ajoutés ou retirés des stopwords ; seuls les autres documents sont re-tokenisés et analysés.
+PREPROC_INCREMENTAL = True
+DOC_CACHE_NAME = "doc_cache.bin" # Hachage du texte -> termes analysés (même format que la table de lemmes)
+ANALYZER_INFO_NAME = "analyzer.json" # Configuration de base et stopwords de l'analyseur du dossier
+DOC_CACHE_DIR = os.path.join(ANALYZER_WORK_DIR, "doc_cache") # Cache et configuration (disque local)
+DOC_CACHE_DRIVE_DIR = os.path.join(ANALYZER_ARTIFACT_DIR, "doc_cache") # Copie persistante (Drive)
+doc_reuse = None # Caches de sorties lus par preprocess_chunk (hérités par les workers au fork)
+
 # Chemins définis précédemment
-# JSONL_OUTPUT_PATH = os.path.join(CORPUS_DIR, "ap_docs.jsonl") # Fichier source (non vide)
+# JSONL_OUTPUT_DIR / JSONL_OUTPUT_PATHS : shards ap_docs.NN.jsonl[.gz|.zst] écrits par la cellule 0.4c
+# TREC_MEMBERS_DIR : membres .gz bruts si CORPUS_FORMAT = "trec" (lus directement, sans JSONL intermédiaire)
 # CORPUS_DIR
 
 # S'assurer que les variables sont définies
 try:
     CORPUS_DIR
-    JSONL_OUTPUT_PATH
+    JSONL_OUTPUT_PATHS
+    CORPUS_COMPRESSION
+    CORPUS_FORMAT
+    JSONL_PREPROC_DIR
 except NameError:
-    print("ERREUR: Les variables CORPUS_DIR ou JSONL_OUTPUT_PATH ne sont pas définies. Ré-exécutez la cellule de configuration.")
+    print("ERREUR: Les variables CORPUS_DIR, JSONL_OUTPUT_PATHS, CORPUS_COMPRESSION, CORPUS_FORMAT ou JSONL_PREPROC_DIR ne sont pas définies. Ré-exécutez la cellule de configuration et la cellule 0.4c.")
     raise
 
-JSONL_PREPROC_PATH = os.path.join(CORPUS_DIR, "ap_docs_preprocessed.jsonl")
-
-print(f"Préparation des données prétraitées depuis {JSONL_OUTPUT_PATH} vers {JSONL_PREPROC_PATH}...")
+# Un shard prétraité par shard source : l'équilibrage et la compression de la cellule 0.4c sont conservés
+# (mode "trec" : les membres sont regroupés en autant de groupes équilibrés que CORPUS_SHARDS)
+if CORPUS_FORMAT == "trec":
+    preproc_sources = balance_paths(trec_member_paths(TREC_MEMBERS_DIR), len(JSONL_OUTPUT_PATHS))
+    iter_source_documents = iter_trec_documents
+    preproc_source_dir = TREC_MEMBERS_DIR
+else:
+    preproc_sources = [[path] for path in JSONL_OUTPUT_PATHS]
+    iter_source_documents = iter_jsonl_documents
+    preproc_source_dir = JSONL_OUTPUT_DIR
+# JSONL_PREPROC_DIR (configuration) : dossier de l'analyseur courant, passé à --input pour l'index prétraité
+JSONL_PREPROC_PATHS = shard_paths(JSONL_PREPROC_DIR, len(preproc_sources), CORPUS_COMPRESSION)
+os.makedirs(JSONL_PREPROC_DIR, exist_ok=True)
+for old_path in set(glob.glob(os.path.join(JSONL_PREPROC_DIR, "*.jsonl*"))) - set(JSONL_PREPROC_PATHS):
+    os.remove(old_path) # Shards d'un autre nombre de shards ou d'une autre compression
+# Le corpus d'un analyseur déjà utilisé est réutilisé tel quel s'il provient du même corpus source
+preproc_identity = {'analyzer_tag': ANALYZER_TAG, 'source': corpus_source_identity(preproc_source_dir),
+                    'shards': len(JSONL_PREPROC_PATHS), 'compression': CORPUS_COMPRESSION}
+preproc_reused, _ = is_artifact_up_to_date(JSONL_PREPROC_DIR, preproc_identity)
+if not preproc_reused and is_artifact_up_to_date(JSONL_PREPROC_DRIVE_DIR, preproc_identity)[0]:
+    # Corpus de cet analyseur construit lors d'une session précédente : restauré depuis le Drive
+    copy_artifact(JSONL_PREPROC_DRIVE_DIR, JSONL_PREPROC_DIR)
+    preproc_reused = True
+    print(f"Corpus prétraité restauré depuis {JSONL_PREPROC_DRIVE_DIR}.")
+
+print(f"Préparation des données prétraitées depuis {preproc_source_dir} vers {JSONL_PREPROC_DIR} ({len(JSONL_PREPROC_PATHS)} shards)...")
+
+def iter_preproc_tasks(sources, stats, chunk_docs):
+    """Découpe les documents de chaque source en blocs : (indice du shard de sortie, [(id, texte), ...])."""
+    for shard_index, source_paths in enumerate(sources):
+        documents = iter_source_documents(source_paths, stats)
+        while True:
+            chunk = list(islice(documents, chunk_docs))
+            if not chunk:
+                break
+            yield shard_index, chunk
+
+def format_preprocessed_doc(doc_id, terms):
+    """Ligne JSONL d'un document prétraité (termes joints par des espaces)."""
+    return json.dumps({"id": doc_id, "contents": ' '.join(terms)}) + '\n'
+
+def preprocess_corpus_line(line):
+    """Ligne JSONL du corpus source -> ligne du corpus prétraité (mises à jour incrémentales de l'index, cellule 1.4)."""
+    doc = json.loads(line)
+    return format_preprocessed_doc(str(doc['id']), analyze_text(doc['contents'])).rstrip('\n')
+
+def analyzer_base_fingerprint():
+    """Empreinte de l'analyseur hors stopwords : deux analyseurs de même base ne diffèrent que par leurs stopwords."""
+    base_config = {key: value for key, value in ANALYZER_CONFIG.items() if key != 'stopwords'}
+    return analyzer_config_fingerprint(dict(base_config, tokenizer=TOKENIZER_MODE))
+
+def find_previous_doc_cache(base_fingerprint):
+    """Cache de sorties d'un analyseur de même base (celui de l'analyseur courant, sinon le plus récent).
+
+    Les caches du disque local et du Drive sont candidats ; un cache du Drive est d'abord copié dans le dossier
+    local de son analyseur. Retourne (chemin du cache, stopwords utilisés pour le produire), ou (None, None).
+    """
+    candidates = {}
+    for artifacts_dir in (ANALYZER_ARTIFACTS_DIR, ANALYZER_WORK_DIRS): # Copie locale prioritaire pour un même analyseur
+        for info_path in glob.glob(os.path.join(artifacts_dir, "*", "doc_cache", ANALYZER_INFO_NAME)):
+            cache_dir = os.path.dirname(info_path)
+            cache_path = os.path.join(cache_dir, DOC_CACHE_NAME)
+            if not os.path.exists(cache_path):
+                continue
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            if info.get('base') == base_fingerprint:
+                tag = os.path.basename(os.path.dirname(cache_dir))
+                candidates[tag] = (tag == ANALYZER_TAG, os.path.getmtime(cache_path), tag, cache_dir, set(info['stopwords']))
+    if not candidates:
+        return None, None
+    _, _, tag, cache_dir, stopwords_used = max(candidates.values())
+    local_dir = os.path.join(ANALYZER_WORK_DIRS, tag, "doc_cache")
+    if os.path.normpath(cache_dir) != os.path.normpath(local_dir):
+        copy_artifact(cache_dir, local_dir) # Lu en mmap par les workers : pas depuis le montage du Drive
+        print(f"  Cache de sorties de l'analyseur {tag} restauré depuis {cache_dir}.")
+    return os.path.join(local_dir, DOC_CACHE_NAME), stopwords_used
+
+def reusable_output(content_hash, contents):
+    """Termes déjà calculés pour ce texte s'ils ne peuvent pas avoir changé, sinon None."""
+    previous = doc_reuse['previous'].get(content_hash)
+    if previous is None:
+        return None
+    # Test conservateur : tout token produit par le tokeniseur est une sous-chaîne du texte en minuscules
+    if doc_reuse['changed_pattern'] is not None and doc_reuse['changed_pattern'].search(contents.lower()):
+        return None
+    return previous.split()
+
+def preprocess_chunk(task):
+    """(Processus fils) Applique preprocess_text à un bloc et retourne le bloc JSONL sérialisé.
+
+    Chaque worker a son propre cache normalize_token (copié au fork) ; on renvoie ses hits/misses pour ce bloc,
+    ainsi que les lemmes absents de la table persistante, que le processus principal enregistre.
+    En mode incrémental, on renvoie aussi les sorties absentes du cache de documents et le nombre de documents réutilisés.
+    """
+    shard_index, chunk = task
+    json_lines, errors, new_outputs, reused = [], [], {}, 0
+    cache_before = token_cache_stats()
+    for doc_id, original_contents in chunk:
+        try:
+            terms, content_hash = None, None
+            if doc_reuse is not None and isinstance(original_contents, str):
+                content_hash = hashlib.blake2b(original_contents.encode('utf-8'), digest_size=16).hexdigest()
+                terms = reusable_output(content_hash, original_contents)
+                reused += terms is not None
+            if terms is None:
+                terms = analyze_text(original_contents)
+            if content_hash is not None and doc_reuse['current'].get(content_hash) is None:
+                new_outputs[content_hash] = ' '.join(terms)
+            json_lines.append(format_preprocessed_doc(str(doc_id), terms))
+        except Exception as e_line:
+            errors.append(f"id={doc_id}: {e_line}")
+    cache_after = token_cache_stats()
+    cache_delta = (cache_after['hits'] - cache_before['hits'], cache_after['misses'] - cache_before['misses'])
+    return shard_index, ''.join(json_lines), len(json_lines), errors, cache_delta, stem_table.drain_new(), new_outputs, reused
+
+def encode_chunk(task):
+    """(Processus fils, phase 1 du mode "vocabulary") Tokenise un bloc et l'encode avec un vocabulaire local.
+
+    Retourne (indice du shard, ids des documents, formes du vocabulaire local, identifiants locaux concaténés,
+    nombre de tokens par document, erreurs) ; le processus principal traduit les identifiants locaux en globaux.
+    """
+    shard_index, chunk = task
+    local_vocabulary, doc_ids, errors = {}, [], []
+    token_ids, lengths = array('I'), array('I')
+    for doc_id, original_contents in chunk:
+        try:
+            tokens = tokenize_text(original_contents) if isinstance(original_contents, str) else []
+        except Exception as e_line:
+            errors.append(f"id={doc_id}: {e_line}")
+            continue
+        token_ids.extend([local_vocabulary.setdefault(token, len(local_vocabulary)) for token in tokens])
+        lengths.append(len(tokens))
+        doc_ids.append(str(doc_id))
+    return shard_index, doc_ids, list(local_vocabulary), token_ids, lengths, errors
+
+def encoded_shard_paths(work_dir, shard_index):
+    """Fichiers intermédiaires d'un shard : identifiants de tokens (uint32), tokens par document, ids des documents."""
+    prefix = os.path.join(work_dir, f"shard.{shard_index:02d}")
+    return prefix + ".ids", prefix + ".lengths", prefix + ".docids"
+
+def rewrite_encoded_shard(shard_index):
+    """(Processus fils, phase 2 du mode "vocabulary") Réécrit un shard encodé via lemma_by_id (hérité au fork)."""
+    ids_path, lengths_path, docids_path = encoded_shard_paths(VOCAB_WORK_DIR, shard_index)
+    lengths = array('I')
+    with open(lengths_path, 'rb') as f:
+        lengths.frombytes(f.read())
+    n_docs = 0
+    with open(ids_path, 'rb') as ids_file, open(docids_path, 'r', encoding='utf-8') as docids_file, \
+         open_corpus_writer(JSONL_PREPROC_PATHS[shard_index]) as outfile:
+        for start in range(0, len(lengths), PREPROC_CHUNK_DOCS):
+            block_lengths = lengths[start:start + PREPROC_CHUNK_DOCS]
+            block = array('I')
+            block.fromfile(ids_file, sum(block_lengths))
+            lemmas = list(map(lemma_by_id.__getitem__, block)) # Une recherche par token pour tout le bloc
+            json_lines, position = [], 0
+            for length in block_lengths:
+                doc_id = docids_file.readline().rstrip('\n')
+                json_lines.append(format_preprocessed_doc(doc_id, list(filter(None, lemmas[position:position + length]))))
+                position += length
+            outfile.write(''.join(json_lines))
+            n_docs += len(block_lengths)
+    return n_docs
 
 # S'assurer que la fonction preprocess_text est définie (normalement fait dans la cellule de setup)
-if 'preprocess_text' not in globals():
+if PREPROC_ANALYZER == "lucene":
+    print(f"Analyseur Lucene ({LUCENE_STEMMER}, stopwords {LUCENE_STOPWORDS}) : aucun corpus prétraité à écrire, la cellule 1.4 indexe directement le corpus source.")
+elif preproc_reused:
+    print(f"Corpus prétraité de l'analyseur {ANALYZER_TAG} déjà à jour dans {JSONL_PREPROC_DIR}, réutilisé.")
+elif 'preprocess_text' not in globals():
     print("Erreur: La fonction 'preprocess_text' n'est pas définie. Ré-exécutez la cellule de configuration.")
     raise NameError("preprocess_text non définie")
 else:
     doc_count_preproc = 0
+    source_stats = {'errors': 0} # Lignes JSON illisibles / sans id, membres TREC corrompus
     error_count = 0
-    # Lire le fichier JSONL original et écrire le fichier prétraité
+    cache_hits, cache_misses = 0, 0
+    # Lire chaque source (shard original ou groupe de membres TREC) par blocs ; un Pool prétraite les blocs
+    # et le processus principal (seul écrivain) les ajoute au shard prétraité correspondant, dans l'ordre d'entrée
+    preproc_fingerprint_path = os.path.normpath(JSONL_PREPROC_DIR) + ".fingerprint"
+    if os.path.exists(preproc_fingerprint_path):
+        os.remove(preproc_fingerprint_path) # Le corpus n'est plus considéré complet pendant la réécriture
     try:
-        # Utiliser utf-8 pour lire et écrire
-        with open(JSONL_OUTPUT_PATH, 'r', encoding='utf-8') as infile, \
-             open(JSONL_PREPROC_PATH, 'w', encoding='utf-8') as outfile:
-
-            # Itérer sur le fichier d'entrée
-            # Utiliser tqdm pour la barre de progression
-            for line in tqdm(infile, desc="Prétraitement des documents"):
-                try:
-                    data = json.loads(line)
-                    # Utiliser .get pour la robustesse si 'id' ou 'contents' manque
-                    doc_id = data.get('id', None)
-                    original_contents = data.get('contents', '')
-
-                    if doc_id is None:
-                        error_count += 1
-                        continue
-
-                    # Appliquer le prétraitement
-                    preprocessed_contents = preprocess_text(original_contents)
-
-                    # Écrire la nouvelle ligne JSONL
-                    json_line = json.dumps({"id": str(doc_id), "contents": str(preprocessed_contents)})
-                    outfile.write(json_line + '\n')
-                    doc_count_preproc += 1
-
-                except json.JSONDecodeError:
-                    # print(f"Avertissement: Erreur de décodage JSON sur une ligne, ignorée.")
-                    error_count += 1
-                except Exception as e_line:
-                    print(f"\nErreur inattendue lors du prétraitement d'une ligne (id={data.get('id', 'inconnu')}): {e_line}")
-                    error_count += 1
-
+        start_time = time.time()
+        if PREPROC_STRATEGY == "vocabulary":
+            # Phase 1 : encodage du corpus en identifiants globaux (le processus principal possède le vocabulaire)
+            VOCAB_WORK_DIR = os.path.join(CORPUS_DIR, "ap_docs_encoded")
+            shutil.rmtree(VOCAB_WORK_DIR, ignore_errors=True)
+            os.makedirs(VOCAB_WORK_DIR)
+            vocabulary = {} # forme de surface -> identifiant
+            n_tokens = 0
+            with ExitStack() as stack:
+                encoded_files = [[stack.enter_context(open(path, mode))
+                                  for path, mode in zip(encoded_shard_paths(VOCAB_WORK_DIR, i), ('wb', 'wb', 'w'))]
+                                 for i in range(len(JSONL_PREPROC_PATHS))]
+                tasks = iter_preproc_tasks(preproc_sources, source_stats, PREPROC_CHUNK_DOCS)
+                progress = stack.enter_context(tqdm(desc=f"Encodage ({PREPROC_WORKERS} workers)", unit=" docs"))
+                for shard_index, doc_ids, local_vocabulary, token_ids, lengths, chunk_errors in iter_ordered_parallel(encode_chunk, tasks, PREPROC_WORKERS):
+                    local_to_global = array('I', [vocabulary.setdefault(token, len(vocabulary)) for token in local_vocabulary])
+                    ids_file, lengths_file, docids_file = encoded_files[shard_index]
+                    array('I', map(local_to_global.__getitem__, token_ids)).tofile(ids_file)
+                    lengths.tofile(lengths_file)
+                    docids_file.write(''.join(doc_id + '\n' for doc_id in doc_ids))
+                    n_tokens += len(token_ids)
+                    for message in chunk_errors:
+                        print(f"\nErreur inattendue lors du prétraitement d'un document ({message})")
+                    error_count += len(chunk_errors)
+                    progress.update(len(doc_ids))
+            encode_time = time.time() - start_time
+
+            # Phase 2 : analyse unique de chaque forme distincte (stopwords + table de lemmes + WordNet)
+            lemma_by_id = [normalize_token(token) for token in vocabulary]
+            n_kept = sum(1 for lemma in lemma_by_id if lemma)
+            analyze_time = time.time() - start_time - encode_time
+            print(f"\n  Vocabulaire: {len(vocabulary)} formes distinctes pour {n_tokens} tokens "
+                  f"({n_kept} conservées, {len(vocabulary) - n_kept} filtrées), analysées en {analyze_time:.1f} s.")
+            del vocabulary
+            # Réécriture : un worker par shard, chacun écrit son propre shard prétraité
+            shard_counts = iter_ordered_parallel(rewrite_encoded_shard, range(len(JSONL_PREPROC_PATHS)), PREPROC_WORKERS)
+            doc_count_preproc = sum(tqdm(shard_counts, total=len(JSONL_PREPROC_PATHS), desc="Réécriture des shards"))
+            shutil.rmtree(VOCAB_WORK_DIR, ignore_errors=True)
+            print(f"  Encodage {encode_time:.1f} s, réécriture {time.time() - start_time - encode_time - analyze_time:.1f} s.")
+        else:
+            reused_docs = 0
+            if PREPROC_INCREMENTAL and PREPROC_ANALYZER == "python":
+                base_fingerprint = analyzer_base_fingerprint()
+                previous_cache_path, previous_stopwords = find_previous_doc_cache(base_fingerprint)
+                os.makedirs(DOC_CACHE_DIR, exist_ok=True)
+                with open(os.path.join(DOC_CACHE_DIR, ANALYZER_INFO_NAME), 'w', encoding='utf-8') as f:
+                    json.dump({'base': base_fingerprint, 'tag': ANALYZER_TAG, 'stopwords': sorted(stop_words_set_global)}, f)
+                doc_cache = StemTable(os.path.join(DOC_CACHE_DIR, DOC_CACHE_NAME))
+                changed_stopwords = previous_stopwords ^ stop_words_set_global if previous_cache_path else set()
+                doc_reuse = {
+                    'current': doc_cache,
+                    'previous': doc_cache if previous_cache_path in (None, os.path.normpath(doc_cache.path))
+                                else StemTable(previous_cache_path),
+                    'changed_pattern': re.compile('|'.join(sorted(map(re.escape, changed_stopwords), key=len, reverse=True)))
+                                       if changed_stopwords else None,
+                }
+                print(f"  Mode incrémental: cache de sorties {previous_cache_path or '(aucun)'} "
+                      f"({len(doc_reuse['previous'])} textes, {len(changed_stopwords)} stopwords modifiés).")
+            with ExitStack() as stack:
+                # Écriture en flux (utf-8), compression à la volée selon l'extension
+                outfiles = [stack.enter_context(open_corpus_writer(path)) for path in JSONL_PREPROC_PATHS]
+                tasks = iter_preproc_tasks(preproc_sources, source_stats, PREPROC_CHUNK_DOCS)
+                progress = stack.enter_context(tqdm(desc=f"Prétraitement ({PREPROC_WORKERS} workers)", unit=" docs"))
+                results = iter_ordered_parallel(preprocess_chunk, tasks, PREPROC_WORKERS)
+                for shard_index, jsonl_block, n_docs, chunk_errors, cache_delta, new_stems, new_outputs, n_reused in results:
+                    outfiles[shard_index].write(jsonl_block)
+                    for token, lemma in new_stems.items():
+                        stem_table.add(token, lemma)
+                    for content_hash, terms in new_outputs.items():
+                        doc_cache.add(content_hash, terms)
+                    reused_docs += n_reused
+                    doc_count_preproc += n_docs
+                    cache_hits, cache_misses = cache_hits + cache_delta[0], cache_misses + cache_delta[1]
+                    for message in chunk_errors:
+                        print(f"\nErreur inattendue lors du prétraitement d'un document ({message})")
+                    error_count += len(chunk_errors)
+                    progress.update(n_docs)
+            if doc_reuse is not None:
+                new_outputs_saved = doc_cache.save()
+                print(f"\n  Incrémental: {reused_docs} documents réutilisés, {doc_count_preproc - reused_docs} re-traités ; "
+                      f"{new_outputs_saved} nouvelles sorties dans le cache de documents.")
+                if doc_reuse['previous'] is not doc_cache:
+                    doc_reuse['previous'].close()
+                doc_cache.close()
+                if new_outputs_saved or not os.path.exists(os.path.join(DOC_CACHE_DRIVE_DIR, DOC_CACHE_NAME)):
+                    copy_artifact(DOC_CACHE_DIR, DOC_CACHE_DRIVE_DIR)
+                    print(f"  Cache de documents copié vers {DOC_CACHE_DRIVE_DIR}.")
+        elapsed = time.time() - start_time
+
+        error_count += source_stats['errors']
         print(f"\nTerminé.")
-        print(f"  {doc_count_preproc} documents prétraités et écrits dans {JSONL_PREPROC_PATH}")
+        print(f"  {doc_count_preproc} documents prétraités et écrits dans {JSONL_PREPROC_DIR}")
+        print(f"  Débit: {doc_count_preproc / elapsed if elapsed > 0 else 0:.0f} docs/s ({PREPROC_STRATEGY}, {PREPROC_WORKERS} worker(s), {elapsed:.1f} secondes).")
+        if cache_hits + cache_misses > 0:
+            print(f"  Cache tokens: {cache_hits / (cache_hits + cache_misses):.1%} de hits "
+                  f"({cache_misses} formes recherchées hors cache pour {cache_hits + cache_misses} tokens).")
+        print(f"  Table de lemmes: {stem_table.save()} nouvelles entrées enregistrées dans {STEM_TABLE_PATH} ({len(stem_table)} au total).")
         if error_count > 0:
-             print(f"  {error_count} lignes ignorées à cause d'erreurs.")
+             print(f"  {error_count} documents ou lignes ignorés à cause d'erreurs.")
 
-        # Vérifier la taille du fichier de sortie
-        if os.path.exists(JSONL_PREPROC_PATH):
-            output_size = os.path.getsize(JSONL_PREPROC_PATH)
-            print(f"  Taille finale de {JSONL_PREPROC_PATH}: {output_size} octets.")
-            if output_size == 0 and doc_count_preproc > 0:
+        # Vérifier la taille des shards de sortie
+        output_sizes = [os.path.getsize(p) for p in JSONL_PREPROC_PATHS if os.path.exists(p)]
+        if len(output_sizes) == len(JSONL_PREPROC_PATHS):
+            print(f"  Taille finale de {JSONL_PREPROC_DIR}: {sum(output_sizes)} octets ({min(output_sizes)} à {max(output_sizes)} par shard).")
+            if sum(output_sizes) == 0 and doc_count_preproc > 0:
                  print("  ATTENTION: 0 octet écrit malgré le traitement de documents. Problème ?")
         else:
-            print(f"  ATTENTION: Le fichier de sortie {JSONL_PREPROC_PATH} n'a pas été créé.")
+            print(f"  ATTENTION: Certains shards de {JSONL_PREPROC_DIR} n'ont pas été créés.")
+        if error_count == 0 and write_artifact_fingerprint(JSONL_PREPROC_DIR, preproc_identity, doc_count_preproc):
+            print(f"  Empreinte enregistrée : ce corpus sera réutilisé pour l'analyseur {ANALYZER_TAG}.")
+            copy_artifact(JSONL_PREPROC_DIR, JSONL_PREPROC_DRIVE_DIR)
+            print(f"  Corpus copié vers {JSONL_PREPROC_DRIVE_DIR}.")
 
 
     except FileNotFoundError:
-        print(f"ERREUR: Le fichier d'entrée {JSONL_OUTPUT_PATH} n'a pas été trouvé.")
+        print(f"ERREUR: Un fichier d'entrée de {preproc_source_dir} n'a pas été trouvé.")
         raise
     except Exception as e_main:
         print(f"ERREUR générale lors de la préparation des données prétraitées: {e_main}")
@@ -5410,13 +7756,15 @@ else:
 
 # === Cellule 1.4: Indexation Avec Prétraitement ===
 import os # Assurer que os est importé
+import glob
 import subprocess # Pour exécuter la commande pyserini
+import time
 import traceback # Pour afficher les erreurs détaillées
 
-# Chemins définis précédemment
-# JSONL_PREPROC_PATH = os.path.join(CORPUS_DIR, "ap_docs_preprocessed.jsonl") # Fichier source
-# INDEX_DIR_PREPROC = os.path.join(OUTPUT_DIR, "indexes/preprocessed") # Dossier cible pour l'index
-# CORPUS_DIR contient le fichier JSONL prétraité
+# Chemins définis précédemment (Partie 7 de la configuration, sous le dossier local de l'analyseur)
+# JSONL_PREPROC_DIR = os.path.join(ANALYZER_WORK_DIR, "corpus") # Shards prétraités (cellule 1.3)
+# INDEX_DIR_PREPROC = os.path.join(ANALYZER_WORK_DIR, "index") # Dossier cible pour l'index
+# INDEX_DIR_PREPROC_DRIVE = os.path.join(ANALYZER_ARTIFACT_DIR, "index") # Copie persistante sur le Drive
 
 # S'assurer que les variables sont définies
 try:
@@ -5430,70 +7778,496 @@ except NameError:
     # INDEX_DIR_PREPROC = os.path.join(OUTPUT_DIR, "indexes/preprocessed")
     raise
 
-JSONL_PREPROC_PATH = os.path.join(CORPUS_DIR, "ap_docs_preprocessed.jsonl") # Chemin complet pour vérification
-
 print(f"Début de l'indexation avec Prétraitement...")
-# Note: Pyserini s'attend à un dossier en entrée pour JsonCollection,
-# il trouvera ap_docs_preprocessed.jsonl dans CORPUS_DIR.
-print(f"Collection source (dossier): {CORPUS_DIR}")
-print(f"Fichier JSONL prétraité attendu: {JSONL_PREPROC_PATH}")
-print(f"Répertoire de l'index cible: {INDEX_DIR_PREPROC}")
-
-# Vérifier si le fichier prétraité existe et n'est pas vide
-if not os.path.exists(JSONL_PREPROC_PATH) or os.path.getsize(JSONL_PREPROC_PATH) == 0:
-    raise FileNotFoundError(f"Le fichier de données prétraitées {JSONL_PREPROC_PATH} est manquant ou vide. Assurez-vous que l'étape précédente (1.3) s'est bien terminée.")
+if PREPROC_ANALYZER == "lucene":
+    # Même source que l'index Baseline (cellule 1.2) : l'analyseur Lucene fait la racinisation et le filtrage
+    try:
+        INDEX_COLLECTION_BASELINE
+        INDEX_INPUT_BASELINE
+        INDEX_THREADS
+    except NameError:
+        print("ERREUR: Les variables de la cellule 1.2 (source de l'index Baseline) ne sont pas définies. Exécutez la cellule 1.2.")
+        raise
+    INDEX_COLLECTION_PREPROC = INDEX_COLLECTION_BASELINE
+    INDEX_INPUT_PREPROC = INDEX_INPUT_BASELINE
+    index_analysis_args = lucene_analyzer_args()
+    index_source_identity = corpus_source_identity(TREC_MEMBERS_DIR if CORPUS_FORMAT == "trec" else JSONL_OUTPUT_DIR)
+    index_update_transform = None # Mises à jour incrémentales : mêmes lignes source que l'index Baseline
+    print(f"Collection source (dossier): {INDEX_INPUT_PREPROC} ({INDEX_COLLECTION_PREPROC}, analyseur Lucene {' '.join(index_analysis_args)})")
+    print(f"Répertoire de l'index cible: {INDEX_DIR_PREPROC}")
+else:
+    # Corpus écrit par la cellule 1.3 (preprocess_text).
+    # Note: Pyserini s'attend à un dossier en entrée pour JsonCollection,
+    # il trouvera les shards ap_docs_preprocessed.NN.jsonl[.gz] dans JSONL_PREPROC_DIR (les .zst sont décompressés avant).
+    print(f"Collection source (dossier): {JSONL_PREPROC_DIR}")
+    print(f"Répertoire de l'index cible: {INDEX_DIR_PREPROC}")
+
+    # Vérifier que les shards prétraités existent et ne sont pas vides
+    jsonl_preproc_paths = sorted(glob.glob(os.path.join(JSONL_PREPROC_DIR, "*.jsonl*")))
+    if not jsonl_preproc_paths or sum(os.path.getsize(p) for p in jsonl_preproc_paths) == 0:
+        raise FileNotFoundError(f"Les shards prétraités de {JSONL_PREPROC_DIR} sont manquants ou vides. Assurez-vous que l'étape précédente (1.3) s'est bien terminée.")
+    INDEX_THREADS = len(jsonl_preproc_paths) # Un thread par shard
+    print(f"  {len(jsonl_preproc_paths)} shards trouvés, indexation avec {INDEX_THREADS} threads.")
+    INDEX_COLLECTION_PREPROC = "JsonCollection" # Termes prétraités joints par des espaces (cellule 1.3)
+    INDEX_INPUT_PREPROC = stage_corpus_for_indexing(JSONL_PREPROC_DIR) # Décompresse seulement les shards .zst
+    index_analysis_args = ["--pretokenized"] # Important: Indique que le texte est déjà tokenisé/traité
+    index_source_identity = load_extraction_fingerprint(JSONL_PREPROC_DIR) # Empreinte du corpus écrite par la cellule 1.3
+    index_update_transform = preprocess_corpus_line # Mises à jour incrémentales : lignes source prétraitées comme en 1.3
 
 # Commande Pyserini pour l'indexation prétraitée
 index_cmd_preproc = [
     "python", "-m", "pyserini.index.lucene",
-    "--collection", "JsonCollection",
-    "--input", CORPUS_DIR, # Pointeur vers le dossier contenant les jsonl
+    "--collection", INDEX_COLLECTION_PREPROC,
+    "--input", INDEX_INPUT_PREPROC, # Pointeur vers le dossier contenant les shards jsonl
     "--index", INDEX_DIR_PREPROC,
     "--generator", "DefaultLuceneDocumentGenerator",
-    "--threads", "4", # Peut être ajusté
-    "--storePositions", "--storeDocvectors", "--storeRaw",
-    "--pretokenized" # Important: Indique que le texte est déjà tokenisé/traité
-]
+    "--threads", str(INDEX_THREADS), # Un thread par shard
+] + index_profile_options(INDEX_PROFILE) + index_analysis_args # --pretokenized, ou --stemmer / --stopwords de l'analyseur Lucene
+
+# Réutiliser l'index de cet analyseur si son manifeste (cellule 0.4b) correspond : même source, analyseur, profil, versions
+index_preproc_identity = {'analyzer_tag': ANALYZER_TAG, 'collection': INDEX_COLLECTION_PREPROC,
+                          'profile': INDEX_PROFILE, 'options': index_profile_options(INDEX_PROFILE) + index_analysis_args,
+                          'versions': index_engine_versions(),
+                          'source': index_source_identity}
+if (index_manifest_differences(INDEX_DIR_PREPROC, index_preproc_identity) not in ([], ['source'])
+        and index_manifest_differences(INDEX_DIR_PREPROC_DRIVE, index_preproc_identity) in ([], ['source'])):
+    # Index de cet analyseur sur le Drive : réutilisable tel quel, ou base d'une mise à jour incrémentale
+    copy_artifact(INDEX_DIR_PREPROC_DRIVE, INDEX_DIR_PREPROC)
+    print(f"Index prétraité restauré depuis {INDEX_DIR_PREPROC_DRIVE}.")
+index_preproc_reused = index_manifest_allows_reuse(INDEX_DIR_PREPROC, index_preproc_identity)
+if index_preproc_reused:
+    print(f"Index de l'analyseur {ANALYZER_TAG} déjà à jour dans {INDEX_DIR_PREPROC} (manifeste identique), indexation sautée.")
+    join_pending_baseline_build()
+else:
+    # Si seul le corpus a changé, mise à jour des membres modifiés au lieu d'une reconstruction complète (cellule 0.4b)
+    try:
+        update_start_time = time.time()
+        preproc_update, preproc_members = update_index_incrementally(
+            index_cmd_preproc, index_preproc_identity, globals().get('INDEX_MEMBER_SOURCE'), index_update_transform)
+    except Exception as e:
+        print(f"\nERREUR pendant la mise à jour incrémentale de l'index prétraité: {e}")
+        traceback.print_exc()
+        raise
+    if preproc_update is not None:
+        print(f"Index de l'analyseur {ANALYZER_TAG} mis à jour par membre en {time.time() - update_start_time:.1f} s: "
+              f"{preproc_update['added']} ajoutés, {preproc_update['replaced']} remplacés, {preproc_update['deleted']} supprimés.")
+        copy_artifact(INDEX_DIR_PREPROC, INDEX_DIR_PREPROC_DRIVE) # Manifeste réécrit par la mise à jour
+        join_pending_baseline_build()
+    else:
+        print(f"Exécution de la commande (par sous-index): {' '.join(index_cmd_preproc)}")
+        # Sous-index parallèles puis fusion (cellule 0.4b) ; moitié des cœurs si l'index Baseline est encore en construction
+        index_start_time = time.time()
+        preproc_build = ShardedIndexBuild(index_cmd_preproc, index_input_paths(INDEX_INPUT_PREPROC),
+                                          cores=(os.cpu_count() or 1) // 2 if globals().get('pending_baseline_build') else None,
+                                          expected_docs=(index_source_identity or {}).get('doc_count')).start()
+        try:
+            join_pending_baseline_build() # Les deux index se construisent en même temps
+        except BaseException:
+            preproc_build.stop() # Ne pas laisser tourner les sous-index prétraités si l'index Baseline échoue
+            raise
+        try:
+            result = preproc_build.wait() # Journaux de pyserini affichés en direct, métriques dans <index>.metrics.json
+            print(f"Durée de l'indexation ({INDEX_COLLECTION_PREPROC}): {time.time() - index_start_time:.1f} secondes "
+                  f"({result['parts']} sous-index, fusion en {result['merge_seconds']:.1f} s).")
+            # Vérifier si la sortie indique un nombre non nul de documents indexés
+            if "Total 0 documents indexed" in result['stdout']:
+                 print("\nATTENTION: Pyserini indique que 0 document a été indexé. Problème potentiel avec l'indexation prétraitée.")
+            else:
+                print(f"\nIndexation avec Prétraitement terminée. Index créé dans {INDEX_DIR_PREPROC}")
+                if preproc_members is not None:
+                    write_index_members(INDEX_DIR_PREPROC, preproc_members) # Base des prochaines mises à jour incrémentales
+                write_index_manifest(INDEX_DIR_PREPROC, index_preproc_identity,
+                                     sum(len(entry['docnos']) for entry in preproc_members) if preproc_members else None)
+                copy_artifact(INDEX_DIR_PREPROC, INDEX_DIR_PREPROC_DRIVE)
+                print(f"Index copié vers {INDEX_DIR_PREPROC_DRIVE}.")
+        except subprocess.CalledProcessError as e:
+            print(f"\nERREUR: L'indexation Prétraitée a échoué avec le code {e.returncode}")
+            print("Sortie STDOUT:\n", e.stdout)
+            print("Sortie STDERR:\n", e.stderr)
+            raise e
+        except subprocess.TimeoutExpired as e:
+            print(f"\nERREUR: L'indexation Prétraitée n'a plus progressé pendant {e.timeout} secondes, processus arrêtés.")
+            print("Sortie STDOUT (partielle):\n", e.stdout)
+            raise e
+        except Exception as e:
+            print(f"\nERREUR inattendue pendant l'indexation Prétraitée: {e}")
+            traceback.print_exc()
+            raise e
 
-# Exécuter la commande
-print(f"Exécution de la commande: {' '.join(index_cmd_preproc)}")
+# Vérification finale de l'index (statistiques par fichier)
+print(f"\nVérification de l'index créé dans {INDEX_DIR_PREPROC}...")
+print_index_statistics(INDEX_DIR_PREPROC)
+
+# === Cellule 1.4a: Rapport de Fidélité du Tokeniseur (regex vs word_tokenize) ===
+# Compare le flux de tokens alphabétiques des deux modes de TOKENIZER_MODE (cellule de configuration) sur un
+# échantillon du corpus et sur toutes les requêtes, ainsi que leur débit. Optionnellement (RUN_TOKENIZER_MAP_REPORT),
+# construit le corpus et l'index prétraités avec l'autre tokeniseur et compare la MAP BM25 des deux index.
+import json
+import glob
+import time
+import subprocess
+from collections import Counter
+from itertools import islice
+import os
+import traceback # Pour afficher les erreurs détaillées
+
+# --- Paramètres ---
+TOKENIZER_REPORT_SAMPLE_DOCS = 5000 # Documents comparés token par token
+RUN_TOKENIZER_MAP_REPORT = False # True : construit un second corpus prétraité + index et compare la MAP
+
+# S'assurer que les variables sont définies
 try:
-    # Utiliser subprocess.run pour une meilleure gestion
-    result = subprocess.run(index_cmd_preproc, check=True, capture_output=True, text=True, timeout=1800) # Timeout 30 minutes
-    print("Sortie STDOUT:\n", result.stdout)
-    print("Sortie STDERR:\n", result.stderr)
-    # Vérifier si la sortie indique un nombre non nul de documents indexés
-    if "Total 0 documents indexed" in result.stdout:
-         print("\nATTENTION: Pyserini indique que 0 document a été indexé. Problème potentiel avec l'indexation prétraitée.")
-    else:
-        print(f"\nIndexation avec Prétraitement terminée. Index créé dans {INDEX_DIR_PREPROC}")
+    preproc_sources
+    iter_source_documents
+    iter_preproc_tasks
+    preprocess_chunk
+    JSONL_PREPROC_DIR
+    INDEX_DIR_PREPROC
+    queries_short
+    queries_long
+    EVAL_DIR
+    QRELS_DIR
+except NameError:
+    print("ERREUR: Variables manquantes. Exécutez la cellule de configuration et les cellules 1.3 et 1.4.")
+    raise
+
+def nltk_alpha_tokens(text):
+    """Tokens alphabétiques de word_tokenize (chemin de référence de preprocess_text)."""
+    return [w for w in word_tokenize(text.lower()) if w.isalpha()]
+
+def regex_alpha_tokens(text):
+    """Tokens alphabétiques de regex_tokenize."""
+    return [w for w in regex_tokenize(text.lower()) if w.isalpha()]
+
+def compare_token_streams(texts):
+    """Compare les deux tokeniseurs sur une liste de textes : accord, tokens manquants/en trop, débit."""
+    start = time.time()
+    nltk_streams = [nltk_alpha_tokens(t) for t in texts]
+    nltk_time = time.time() - start
+    start = time.time()
+    regex_streams = [regex_alpha_tokens(t) for t in texts]
+    regex_time = time.time() - start
+    identical, nltk_total, matched = 0, 0, 0
+    missing, extra = Counter(), Counter()
+    for nltk_tokens, regex_tokens in zip(nltk_streams, regex_streams):
+        nltk_total += len(nltk_tokens)
+        if nltk_tokens == regex_tokens:
+            identical += 1
+            matched += len(nltk_tokens)
+            continue
+        nltk_counts, regex_counts = Counter(nltk_tokens), Counter(regex_tokens)
+        matched += sum((nltk_counts & regex_counts).values())
+        missing.update(nltk_counts - regex_counts)
+        extra.update(regex_counts - nltk_counts)
+    return {
+        'texts': len(texts), 'identical_texts': identical,
+        'identical_rate': identical / len(texts) if texts else 1.0,
+        'nltk_tokens': nltk_total, 'token_agreement': matched / nltk_total if nltk_total else 1.0,
+        'missing_tokens': missing.most_common(20), 'extra_tokens': extra.most_common(20),
+        'nltk_seconds': nltk_time, 'regex_seconds': regex_time,
+        'speedup': nltk_time / regex_time if regex_time > 0 else None,
+    }
+
+def print_comparison(label, report):
+    print(f"\n  {label}: {report['identical_texts']}/{report['texts']} textes identiques ({report['identical_rate']:.2%}), "
+          f"accord sur {report['token_agreement']:.4%} des {report['nltk_tokens']} tokens NLTK.")
+    print(f"    Débit: word_tokenize {report['nltk_seconds']:.2f} s, regex {report['regex_seconds']:.2f} s"
+          + (f" (x{report['speedup']:.1f})" if report['speedup'] else ""))
+    if report['missing_tokens']:
+        print(f"    Absents du mode regex: {report['missing_tokens'][:10]}")
+    if report['extra_tokens']:
+        print(f"    En trop dans le mode regex: {report['extra_tokens'][:10]}")
+
+def build_preprocessed_variant(mode, output_dir):
+    """Écrit le corpus prétraité avec TOKENIZER_MODE = mode (même découpage en shards que la cellule 1.3)."""
+    global TOKENIZER_MODE, doc_reuse
+    previous_mode, TOKENIZER_MODE = TOKENIZER_MODE, mode # Hérité par les workers (fork au premier bloc)
+    doc_reuse = None # Le cache de documents de la cellule 1.3 correspond à l'autre tokeniseur
+    output_paths = shard_paths(output_dir, len(preproc_sources), CORPUS_COMPRESSION)
+    os.makedirs(output_dir, exist_ok=True)
+    for old_path in set(glob.glob(os.path.join(output_dir, "*.jsonl*"))) - set(output_paths):
+        os.remove(old_path)
+    stats, n_docs = {'errors': 0}, 0
+    start = time.time()
+    try:
+        with ExitStack() as stack:
+            outfiles = [stack.enter_context(open_corpus_writer(path)) for path in output_paths]
+            tasks = iter_preproc_tasks(preproc_sources, stats, PREPROC_CHUNK_DOCS)
+            for shard_index, jsonl_block, block_docs, _, _, new_stems, _, _ in iter_ordered_parallel(preprocess_chunk, tasks, PREPROC_WORKERS):
+                outfiles[shard_index].write(jsonl_block)
+                for token, lemma in new_stems.items():
+                    stem_table.add(token, lemma)
+                n_docs += block_docs
+    finally:
+        TOKENIZER_MODE = previous_mode
+    stem_table.save()
+    elapsed = time.time() - start
+    print(f"  Corpus prétraité ({mode}): {n_docs} documents en {elapsed:.1f} s ({n_docs / elapsed if elapsed > 0 else 0:.0f} docs/s) -> {output_dir}")
+    return {'docs': n_docs, 'seconds': elapsed}
+
+def preprocess_queries(queries, mode):
+    """Prétraite un dictionnaire de requêtes avec le tokeniseur donné."""
+    global TOKENIZER_MODE
+    previous_mode, TOKENIZER_MODE = TOKENIZER_MODE, mode
+    try:
+        return {qid: preprocess_text(text) for qid, text in queries.items()}
+    finally:
+        TOKENIZER_MODE = previous_mode
+
+def load_qrels_dict(qrels_dir):
+    """Qrels TREC ({query_id: {doc_id: relevance}}), jugements négatifs ignorés comme dans la cellule 6."""
+    qrels = {}
+    for qf in sorted(glob.glob(os.path.join(qrels_dir, "qrels.*.txt"))):
+        with open(qf, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 4 or int(parts[3]) < 0:
+                    continue
+                qrels.setdefault(parts[0], {})[parts[2]] = int(parts[3])
+    return qrels
+
+def bm25_map(index_path, queries, qrels, k=1000):
+    """MAP d'un run BM25 (k1=0.9, b=0.4, comme la cellule 3.1) sur les requêtes déjà prétraitées."""
+    import pytrec_eval
+    from pyserini.search.lucene import LuceneSearcher
+    searcher = LuceneSearcher(index_path)
+    searcher.set_bm25(k1=0.9, b=0.4)
+    run = {}
+    for qid, text in queries.items():
+        if text.strip():
+            run[qid] = {hit.docid: float(hit.score) for hit in searcher.search(text, k=k)}
+    searcher.close()
+    results = pytrec_eval.RelevanceEvaluator(qrels, {'map'}).evaluate({q: r for q, r in run.items() if q in qrels})
+    return sum(r['map'] for r in results.values()) / len(results) if results else 0.0
+
+fidelity_report = {'reference_mode': TOKENIZER_MODE, 'sample_docs': TOKENIZER_REPORT_SAMPLE_DOCS}
+try:
+    # --- 1. Flux de tokens sur un échantillon de documents et sur les requêtes ---
+    print(f"Comparaison des tokeniseurs sur {TOKENIZER_REPORT_SAMPLE_DOCS} documents et {len(queries_short) + len(queries_long)} requêtes...")
+    sample_stats = {'errors': 0}
+    sample_docs = [contents for _, contents in islice(
+        (doc for paths in preproc_sources for doc in iter_source_documents(paths, sample_stats)), TOKENIZER_REPORT_SAMPLE_DOCS)]
+    fidelity_report['documents'] = compare_token_streams(sample_docs)
+    fidelity_report['queries'] = compare_token_streams(list(queries_short.values()) + list(queries_long.values()))
+    print_comparison("Documents", fidelity_report['documents'])
+    print_comparison("Requêtes", fidelity_report['queries'])
+
+    # --- 2. (Optionnel) MAP BM25 avec chaque tokeniseur ---
+    if RUN_TOKENIZER_MAP_REPORT and PREPROC_ANALYZER == "lucene":
+        print("\nMAP non comparée : l'index prétraité utilise l'analyseur Lucene (PREPROC_ANALYZER), pas le tokeniseur Python.")
+    elif RUN_TOKENIZER_MAP_REPORT:
+        other_mode = "regex" if TOKENIZER_MODE == "nltk" else "nltk"
+        other_artifact_dir = os.path.join(ANALYZER_WORK_DIRS, analyzer_artifact_tag(other_mode)) # Dossier local de TOKENIZER_MODE = other_mode
+        other_corpus_dir = os.path.join(other_artifact_dir, "corpus")
+        other_index_dir = os.path.join(other_artifact_dir, "index")
+        print(f"\nConstruction du corpus et de l'index prétraités avec le tokeniseur {other_mode}...")
+        fidelity_report['other_corpus'] = build_preprocessed_variant(other_mode, other_corpus_dir)
+        index_cmd_other = [
+            "python", "-m", "pyserini.index.lucene",
+            "--collection", "JsonCollection",
+            "--input", stage_corpus_for_indexing(other_corpus_dir),
+            "--index", other_index_dir,
+            "--generator", "DefaultLuceneDocumentGenerator",
+            "--threads", str(len(preproc_sources)),
+            "--pretokenized"
+        ] + index_profile_options(INDEX_PROFILE)
+        print(f"Exécution de la commande: {' '.join(index_cmd_other)}")
+        ShardedIndexBuild(index_cmd_other, index_input_paths(index_cmd_other[index_cmd_other.index("--input") + 1])).start().wait()
+
+        qrels_dict = load_qrels_dict(QRELS_DIR)
+        if not qrels_dict:
+            print(f"ATTENTION: Aucun jugement trouvé dans {QRELS_DIR}, MAP non calculée.")
+        else:
+            indexes = {TOKENIZER_MODE: INDEX_DIR_PREPROC, other_mode: other_index_dir}
+            fidelity_report['map'] = {}
+            for mode, index_path in indexes.items():
+                for query_type, queries in [('short', queries_short), ('long', queries_long)]:
+                    score = bm25_map(index_path, preprocess_queries(queries, mode), qrels_dict)
+                    fidelity_report['map'][f"{mode}_{query_type}"] = score
+                    print(f"  MAP BM25 {mode:5s} / requêtes {query_type:5s}: {score:.4f}")
+            for query_type in ['short', 'long']:
+                delta = fidelity_report['map'][f"regex_{query_type}"] - fidelity_report['map'][f"nltk_{query_type}"]
+                print(f"  Écart MAP regex - nltk (requêtes {query_type}): {delta:+.4f}")
+
+    report_path = os.path.join(EVAL_DIR, "tokenizer_fidelity.json")
+    os.makedirs(EVAL_DIR, exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(fidelity_report, f, indent=2, ensure_ascii=False)
+    print(f"\nRapport de fidélité sauvegardé dans {report_path}")
 except subprocess.CalledProcessError as e:
-    print(f"\nERREUR: L'indexation Prétraitée a échoué avec le code {e.returncode}")
-    print("Sortie STDOUT:\n", e.stdout)
+    print(f"\nERREUR: L'indexation avec l'autre tokeniseur a échoué avec le code {e.returncode}")
     print("Sortie STDERR:\n", e.stderr)
-    raise e
-except subprocess.TimeoutExpired as e:
-    print(f"\nERREUR: L'indexation Prétraitée a dépassé le délai d'attente.")
-    print("Sortie STDOUT (partielle):\n", e.stdout)
-    print("Sortie STDERR (partielle):\n", e.stderr)
-    raise e
+    raise
 except Exception as e:
-    print(f"\nERREUR inattendue pendant l'indexation Prétraitée: {e}")
+    print(f"\nERREUR lors du rapport de fidélité du tokeniseur: {e}")
     traceback.print_exc()
-    raise e
+    raise
 
-# Vérification finale de l'index (taille)
-print(f"\nVérification de la taille de l'index créé dans {INDEX_DIR_PREPROC}...")
-if os.path.exists(INDEX_DIR_PREPROC):
-    # Commande pour obtenir la taille totale du dossier
-    du_cmd = f"du -sh '{INDEX_DIR_PREPROC}'"
-    try:
-        result_du = subprocess.run(du_cmd, shell=True, check=True, capture_output=True, text=True)
-        print(f"  Taille de l'index: {result_du.stdout.split()[0]}")
-    except Exception as e_du:
-        print(f"  Impossible de vérifier la taille de l'index: {e_du}")
+
+# === Cellule 1.4b: Microbenchmark de l'Analyse Lucene par Lots ===
+# Coût par document de LuceneBatchAnalyzer (configuration) selon la taille de lot : 1 = un aller-retour JNI par
+# texte (comme pyserini.analysis.Analyzer), 64 et 1024 = un seul aller-retour par lot. Les tokens de chaque taille
+# de lot sont comparés à ceux de la première taille.
+import json
+import time
+from itertools import islice
+import os
+import traceback # Pour afficher les erreurs détaillées
+
+# --- Paramètres ---
+ANALYSIS_BENCHMARK_DOCS = 4096 # Documents analysés pour chaque taille de lot
+ANALYSIS_BENCHMARK_BATCH_SIZES = [1, 64, 1024] # La première taille sert de référence
+
+try:
+    preproc_sources
+    iter_source_documents
+    EVAL_DIR
+except NameError:
+    print("ERREUR: Variables manquantes. Exécutez la cellule de configuration et la cellule 1.3.")
+    raise
+
+def benchmark_batch_analysis(analyzer, texts, batch_sizes):
+    """Temps par document de l'analyse Lucene pour chaque taille de lot, et identité des tokens produits."""
+    analyzer.analyze_batch(texts[:64]) # Chauffe de la JVM (JIT) avant les mesures
+    results, reference = {}, None
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        if batch_size == 1:
+            outputs = [analyzer.analyze(text) for text in texts]
+        else:
+            outputs = [tokens for i in range(0, len(texts), batch_size) for tokens in analyzer.analyze_batch(texts[i:i + batch_size])]
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = outputs
+        results[batch_size] = {'seconds': elapsed, 'us_per_doc': elapsed / len(texts) * 1e6,
+                               'docs_per_sec': len(texts) / elapsed if elapsed > 0 else 0.0,
+                               'identical_tokens': outputs == reference}
+    return results
+
+try:
+    sample_stats = {'errors': 0}
+    benchmark_texts = [contents for _, contents in islice(
+        (doc for paths in preproc_sources for doc in iter_source_documents(paths, sample_stats)), ANALYSIS_BENCHMARK_DOCS)]
+    print(f"Analyse Lucene ({LUCENE_STEMMER}, stopwords {LUCENE_STOPWORDS}) de {len(benchmark_texts)} documents par lots de {ANALYSIS_BENCHMARK_BATCH_SIZES}...")
+    batch_results = benchmark_batch_analysis(lucene_batch_analyzer(), benchmark_texts, ANALYSIS_BENCHMARK_BATCH_SIZES)
+    base_cost = batch_results[ANALYSIS_BENCHMARK_BATCH_SIZES[0]]['us_per_doc']
+    for batch_size, result in batch_results.items():
+        print(f"  Lot de {batch_size:5d}: {result['us_per_doc']:8.1f} µs/doc ({result['docs_per_sec']:.0f} docs/s, "
+              f"x{base_cost / result['us_per_doc']:.1f}), tokens identiques: {result['identical_tokens']}")
+
+    report_path = os.path.join(EVAL_DIR, "lucene_batch_analysis.json")
+    os.makedirs(EVAL_DIR, exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'docs': len(benchmark_texts), 'stemmer': LUCENE_STEMMER, 'stopwords': LUCENE_STOPWORDS,
+                   'batches': batch_results}, f, indent=2)
+    print(f"\nRésultats sauvegardés dans {report_path}")
+except Exception as e:
+    print(f"\nERREUR lors du microbenchmark d'analyse Lucene: {e}")
+    traceback.print_exc()
+    raise
+
+
+# === Cellule 1.4c: Rapport des Profils d'Index (taille, durée de construction, latence) ===
+# Construit l'index prétraité (même source et même analyse que la cellule 1.4) avec chaque profil de INDEX_PROFILES,
+# puis mesure la durée de construction, les octets par composant Lucene et la latence de recherche BM25
+# (et RM3 pour les profils qui conservent les vecteurs de documents). Désactivé par défaut (RUN_INDEX_PROFILE_REPORT).
+import json
+import shutil
+import subprocess
+import time
+import os
+import traceback # Pour afficher les erreurs détaillées
+
+# --- Paramètres ---
+RUN_INDEX_PROFILE_REPORT = False # True : reconstruit l'index prétraité une fois par profil (plusieurs builds complets)
+PROFILE_REPORT_DIR = os.path.join(OUTPUT_DIR, "index_profiles") # Index temporaires, un par profil (disque local)
+PROFILE_LATENCY_K = 1000 # Documents retournés par requête (comme K_RESULTS)
+KEEP_PROFILE_INDEXES = False # True : conserve les index construits pour chaque profil
+
+def search_latency(index_path, queries, k, rm3=False):
+    """Latence par requête (ms, moyenne et 95e centile) d'une recherche BM25, avec ou sans RM3."""
+    from pyserini.search.lucene import LuceneSearcher
+    searcher = LuceneSearcher(index_path)
+    configure_searcher_analyzer(searcher, index_path)
+    searcher.set_bm25(k1=0.9, b=0.4)
+    if rm3:
+        searcher.set_rm3(fb_terms=10, fb_docs=10, original_query_weight=0.5)
+    texts = [text for text in queries.values() if text.strip()]
+    searcher.search(texts[0], k=k) # Chauffe (JIT, cache des fichiers) avant les mesures
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        searcher.search(text, k=k)
+        timings.append((time.perf_counter() - start) * 1000)
+    searcher.close()
+    timings.sort()
+    return {'queries': len(timings), 'mean_ms': sum(timings) / len(timings), 'p95_ms': timings[int(0.95 * (len(timings) - 1))]}
+
+if not RUN_INDEX_PROFILE_REPORT:
+    print("Rapport des profils d'index non demandé (RUN_INDEX_PROFILE_REPORT = False).")
 else:
-    print("  ATTENTION: Le dossier de l'index n'a pas été créé.")
+    try:
+        INDEX_COLLECTION_PREPROC
+        INDEX_INPUT_PREPROC
+        INDEX_THREADS
+        index_analysis_args
+        queries_short_preprocessed
+        EVAL_DIR
+    except NameError:
+        print("ERREUR: Variables manquantes. Exécutez la cellule de configuration et la cellule 1.4.")
+        raise
+
+    profile_report = {'selected_profile': INDEX_PROFILE, 'needs': SEARCH_INDEX_NEEDS, 'collection': INDEX_COLLECTION_PREPROC, 'profiles': {}}
+    try:
+        for profile in INDEX_PROFILES:
+            profile_index_dir = os.path.join(PROFILE_REPORT_DIR, profile)
+            shutil.rmtree(profile_index_dir, ignore_errors=True)
+            index_cmd_profile = [
+                "python", "-m", "pyserini.index.lucene",
+                "--collection", INDEX_COLLECTION_PREPROC,
+                "--input", INDEX_INPUT_PREPROC,
+                "--index", profile_index_dir,
+                "--generator", "DefaultLuceneDocumentGenerator",
+                "--threads", str(INDEX_THREADS),
+            ] + index_profile_options(profile) + index_analysis_args
+            print(f"Profil {profile} {INDEX_PROFILES[profile]}: construction de l'index dans {profile_index_dir}...")
+            build_start = time.time()
+            ShardedIndexBuild(index_cmd_profile, index_input_paths(INDEX_INPUT_PREPROC)).start().wait() # Sous-index + fusion, comme la cellule 1.4
+            component_sizes = index_component_sizes(profile_index_dir)
+            result = {'options': index_profile_options(profile), 'build_seconds': time.time() - build_start,
+                      'total_bytes': sum(component_sizes.values()), 'component_bytes': component_sizes,
+                      'latency_bm25': search_latency(profile_index_dir, queries_short_preprocessed, PROFILE_LATENCY_K)}
+            if set(INDEX_PROFILES["prf"]) <= set(INDEX_PROFILES[profile]): # RM3 exige les vecteurs de documents
+                result['latency_rm3'] = search_latency(profile_index_dir, queries_short_preprocessed, PROFILE_LATENCY_K, rm3=True)
+            profile_report['profiles'][profile] = result
+            print(f"  {result['build_seconds']:.1f} s, {result['total_bytes'] / 1e6:.1f} Mo "
+                  f"({', '.join(f'{name} {size / 1e6:.1f}' for name, size in sorted(component_sizes.items()))}), "
+                  f"BM25 {result['latency_bm25']['mean_ms']:.1f} ms/requête"
+                  + (f", RM3 {result['latency_rm3']['mean_ms']:.1f} ms/requête" if 'latency_rm3' in result else ""))
+            if not KEEP_PROFILE_INDEXES:
+                shutil.rmtree(profile_index_dir, ignore_errors=True)
+        if not KEEP_PROFILE_INDEXES:
+            shutil.rmtree(PROFILE_REPORT_DIR, ignore_errors=True)
+
+        full_bytes = profile_report['profiles']['full']['total_bytes']
+        selected = profile_report['profiles'][INDEX_PROFILE]
+        size_ratio = selected['total_bytes'] / full_bytes if full_bytes else 0.0
+        print(f"\nProfil retenu pour les cellules 1.2 et 1.4: {INDEX_PROFILE} ({size_ratio:.0%} de la taille du profil full)")
+
+        report_path = os.path.join(EVAL_DIR, "index_profiles.json")
+        os.makedirs(EVAL_DIR, exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(profile_report, f, indent=2, ensure_ascii=False)
+        print(f"\nRapport des profils d'index sauvegardé dans {report_path}")
+    except subprocess.CalledProcessError as e:
+        print(f"\nERREUR: L'indexation du profil a échoué avec le code {e.returncode}")
+        print("Sortie STDERR:\n", e.stderr)
+        raise
+    except Exception as e:
+        print(f"\nERREUR lors du rapport des profils d'index: {e}")
+        traceback.print_exc()
+        raise
+
 
 # === Cellule 3.1: Exécuter les Recherches (Séquentielles - BM25 & TF-IDF) ===
 # Utilise la dernière Pyserini et Java 21 (devraient être actifs)
@@ -5557,6 +8331,7 @@ def perform_search_sequential(queries, index_path, model, k, output_run_file, ru
         # Assurer que LuceneSearcher est importé
         from pyserini.search.lucene import LuceneSearcher
         searcher = LuceneSearcher(index_path)
+        configure_searcher_analyzer(searcher, index_path)
         print(f"  LuceneSearcher initialisé.")
 
         # Configurer le modèle de similarité
@@ -5748,7 +8523,7 @@ def perform_search_sequential_rm3(queries, index_path, model_base, k, output_run
     all_results_list = []
     searcher = None
     try:
-        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); print(f"  LuceneSearcher initialisé.")
+        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); configure_searcher_analyzer(searcher, index_path); print(f"  LuceneSearcher initialisé.")
         if model_base == 'bm25': print("  Config BM25 (base)..."); searcher.set_bm25(k1=0.9, b=0.4)
         elif model_base == 'tfidf':
             if ClassicSimilarity is None: raise ValueError("ClassicSimilarity non chargée.")
@@ -5835,7 +8610,7 @@ def perform_search_sequential(queries, index_path, model, k, output_run_file, ru
     searcher = None
 
     try:
-        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); print(f"  LuceneSearcher initialisé.")
+        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); configure_searcher_analyzer(searcher, index_path); print(f"  LuceneSearcher initialisé.")
         if model == 'bm25': print("  Config BM25..."); searcher.set_bm25(k1=0.9, b=0.4); print("  BM25 configuré.")
         elif model == 'tfidf':
             if ClassicSimilarity is None: print("ERREUR: ClassicSimilarity non chargée. ABANDON."); return
@@ -5938,7 +8713,7 @@ def perform_search_sequential(queries, index_path, model, k, output_run_file, ru
     searcher = None
 
     try:
-        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); print(f"  LuceneSearcher initialisé.")
+        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); configure_searcher_analyzer(searcher, index_path); print(f"  LuceneSearcher initialisé.")
         if model == 'bm25': print("  Config BM25..."); searcher.set_bm25(k1=0.9, b=0.4); print("  BM25 configuré.")
         elif model == 'tfidf':
             if ClassicSimilarity is None: print("ERREUR: ClassicSimilarity non chargée. ABANDON."); return
@@ -6087,9 +8862,12 @@ try:
     preprocess_text;
     if not os.path.exists(INDEX_DIR_BASELINE): raise FileNotFoundError(f"Index Baseline restauré manquant: {INDEX_DIR_BASELINE}")
     if not os.path.exists(INDEX_DIR_PREPROC): raise FileNotFoundError(f"Index Preprocessed restauré manquant: {INDEX_DIR_PREPROC}")
-    # Vérifier aussi que les fichiers de corpus sont là (restaurés)
-    if not os.path.exists(os.path.join(CORPUS_DIR, "ap_docs.jsonl")): raise FileNotFoundError("ap_docs.jsonl manquant après restauration.")
-    if not os.path.exists(os.path.join(CORPUS_DIR, "ap_docs_preprocessed.jsonl")): raise FileNotFoundError("ap_docs_preprocessed.jsonl manquant après restauration.")
+    # Vérifier aussi que les shards du corpus sont là (restaurés) : ap_docs.NN.jsonl[.gz|.zst] (cellules 0.4c et 1.3)
+    jsonl_output_dir = globals().get('JSONL_OUTPUT_DIR', os.path.join(CORPUS_DIR, "ap_docs"))
+    if not glob.glob(os.path.join(jsonl_output_dir, "*.jsonl*")): raise FileNotFoundError(f"Shards du corpus manquants dans {jsonl_output_dir} après restauration.")
+    # En mode Lucene, la cellule 1.3 n'écrit aucun corpus prétraité (l'index prétraité lit le corpus source)
+    preproc_corpus_written = globals().get('PREPROC_ANALYZER', "python") != "lucene"
+    if preproc_corpus_written and not glob.glob(os.path.join(JSONL_PREPROC_DIR, "*.jsonl*")): raise FileNotFoundError(f"Shards prétraités manquants dans {JSONL_PREPROC_DIR} après restauration.")
 
 except NameError as e: print(f"ERREUR: Variable {e} manquante. Exécutez config complète."); raise
 except FileNotFoundError as e: print(f"ERREUR: {e}"); raise
@@ -6104,7 +8882,7 @@ def perform_search_sequential_qld(queries, index_path, model, k, output_run_file
     searcher = None
 
     try:
-        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); print(f"  LuceneSearcher initialisé.")
+        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); configure_searcher_analyzer(searcher, index_path); print(f"  LuceneSearcher initialisé.")
 
         # Configurer similarité
         if model == 'bm25':
@@ -6376,7 +9154,7 @@ def perform_search_sequential_rm3(queries, index_path, model_base, k, output_run
     all_results_list = []
     searcher = None
     try:
-        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); print(f"  LuceneSearcher initialisé.")
+        print(f"  Initialisation LuceneSearcher..."); searcher = LuceneSearcher(index_path); configure_searcher_analyzer(searcher, index_path); print(f"  LuceneSearcher initialisé.")
         # Configurer similarité base
         if model_base == 'bm25': print("  Config BM25 (base)..."); searcher.set_bm25(k1=0.9, b=0.4)
         elif model_base == 'qld': print("  Config QLD (base)..."); searcher.set_qld()
@@ -6427,19 +9205,12 @@ print(f"\nVérification de la création du fichier {PRF_RUN_FILE}...")
 !ls -l "{PRF_RUN_FILE}"
 
 import nltk
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
 
 nltk.download("stopwords")
 nltk.download("punkt")
 
-ps = PorterStemmer()
-stop_words = set(stopwords.words("english"))
-
-def preprocess(text):
-    tokens = nltk.word_tokenize(text.lower())
-    filtered = [ps.stem(token) for token in tokens if token.isalnum() and token not in stop_words]
-    return " ".join(filtered)
+# Porter + isalnum : analyseur "porter-alnum" du registre (Partie 7 de la configuration), sans changer celui de la session
+preprocess = analyzer_function("porter-alnum")
 
 !pip install pysolr
 
@@ -6557,30 +9328,21 @@ print(f"Terminé. {doc_count} documents formatés dans {JSONL_OUTPUT_PATH}")
 # Si c'est juste AP.tar (non compressé), changez "r:gz" en "r:"
 
 # === Cellule 1.1: Fonction de Prétraitement ===
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-import string
-
-stop_words = set(stopwords.words('english'))
-lemmatizer = WordNetLemmatizer()
-
-def preprocess_text(text):
-    """
-    Applique la tokenisation, la mise en minuscule, la suppression
-    de la ponctuation, la suppression des stop words et la lemmatisation.
-    """
-    # Tokenisation et minuscules
-    tokens = word_tokenize(text.lower())
+# WordNet + isalpha : analyseur "lemma" du registre (Partie 7 de la configuration) s'il est défini. Cette section
+# peut aussi s'exécuter seule (cellules 0.2 et 0.3) : la même analyse est alors construite ici.
+if 'analyzer_function' in globals():
+    preprocess_text = analyzer_function("lemma")
+else:
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    from nltk.tokenize import word_tokenize
 
-    # Suppression ponctuation et mots non alphabétiques + stop words
-    filtered_tokens = [
-        lemmatizer.lemmatize(w) for w in tokens
-        if w.isalpha() and w not in stop_words # Garde seulement les mots alphabétiques non-stop words
-    ]
+    stop_words = set(stopwords.words('english'))
+    lemmatizer = WordNetLemmatizer()
 
-    # Rejoint les tokens en une chaîne de caractères
-    return ' '.join(filtered_tokens)
+    def preprocess_text(text):
+        """Tokenisation, minuscules, mots alphabétiques hors stop words, lemmatisation WordNet (analyseur "lemma")."""
+        return ' '.join(lemmatizer.lemmatize(w) for w in word_tokenize(text.lower()) if w.isalpha() and w not in stop_words)
 
 # Exemple d'utilisation
 sample_text = "This is an example showing Information Retrieval with lemmatization and stop words removal."
@@ -6758,6 +9520,7 @@ def perform_search_single_query(args):
     try:
         # Initialiser le searcher DANS le processus fils
         searcher = LuceneSearcher(index_path)
+        configure_searcher_analyzer(searcher, index_path)
 
         # Configurer le modèle de similarité
         if model == 'bm25':
@@ -6893,6 +9656,7 @@ def perform_search_sequential(queries, index_path, model, k, output_run_file, ru
         # Initialiser le searcher UNE SEULE FOIS pour toutes les requêtes de ce run
         print(f"  Initialisation de LuceneSearcher pour {run_tag}...")
         searcher = LuceneSearcher(index_path)
+        configure_searcher_analyzer(searcher, index_path)
         print(f"  LuceneSearcher initialisé.")
 
         # Configurer le modèle de similarité
@@ -7002,30 +9766,21 @@ print("Toutes les recherches de base (mode séquentiel) sont terminées.")
 !pip install pyserini
 
 # === Cellule 1.1: Fonction de Prétraitement ===
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-import string
-
-stop_words = set(stopwords.words('english'))
-lemmatizer = WordNetLemmatizer()
-
-def preprocess_text(text):
-    """
-    Applique la tokenisation, la mise en minuscule, la suppression
-    de la ponctuation, la suppression des stop words et la lemmatisation.
-    """
-    # Tokenisation et minuscules
-    tokens = word_tokenize(text.lower())
+# WordNet + isalpha : analyseur "lemma" du registre (Partie 7 de la configuration) s'il est défini. Cette section
+# peut aussi s'exécuter seule (cellules 0.2 et 0.3) : la même analyse est alors construite ici.
+if 'analyzer_function' in globals():
+    preprocess_text = analyzer_function("lemma")
+else:
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    from nltk.tokenize import word_tokenize
 
-    # Suppression ponctuation et mots non alphabétiques + stop words
-    filtered_tokens = [
-        lemmatizer.lemmatize(w) for w in tokens
-        if w.isalpha() and w not in stop_words # Garde seulement les mots alphabétiques non-stop words
-    ]
+    stop_words = set(stopwords.words('english'))
+    lemmatizer = WordNetLemmatizer()
 
-    # Rejoint les tokens en une chaîne de caractères
-    return ' '.join(filtered_tokens)
+    def preprocess_text(text):
+        """Tokenisation, minuscules, mots alphabétiques hors stop words, lemmatisation WordNet (analyseur "lemma")."""
+        return ' '.join(lemmatizer.lemmatize(w) for w in word_tokenize(text.lower()) if w.isalpha() and w not in stop_words)
 
 # Exemple d'utilisation
 sample_text = "This is an example showing Information Retrieval with lemmatization and stop words removal."